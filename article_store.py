@@ -0,0 +1,491 @@
+from __future__ import annotations
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Iterable, Iterator
+from os.path import join, exists
+import os
+import mmap
+import shutil
+import re
+import sqlite3
+import zstandard
+
+# 2: Category index
+# 3: Redirect index
+STORE_FORMAT = 3
+
+DATA_FILE = "articles.bin"
+INDEX_FILE = "articles.sqlite"
+
+# Updates compact the data file once more than this fraction of it is replaced or removed records.
+COMPACT_THRESHOLD = 0.25
+
+
+CATEGORY_LINK = re.compile(r"\[\[\s*category\s*:\s*([^\]|\n]+)", re.IGNORECASE)
+REDIRECT = re.compile(r"\s*#REDIRECT\s*:?\s*\[\[([^\]|#\n]*)", re.IGNORECASE)
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a linked title like MediaWiki does (e.g. "foo_bar" -> "Foo bar")."""
+    title = " ".join(title.replace("_", " ").split()).removeprefix(":").lstrip()
+    return title[:1].upper() + title[1:]
+
+
+def normalize_category(name: str) -> str:
+    """Normalize a category name like MediaWiki does, without the namespace (e.g. "category:foo_bar" -> "Foo bar")."""
+    return normalize_title(re.sub(r"^\s*category\s*:", "", name, flags=re.IGNORECASE))
+
+
+def redirect_target(content: str) -> str | None:
+    """The title an article redirects to, if it's a redirect."""
+    match = REDIRECT.match(content)
+    return normalize_title(match.group(1)) if match else None
+
+
+def extract_categories(content: str) -> list[str]:
+    """The categories an article is explicitly linked to. Categories added by templates aren't included."""
+    return list(
+        dict.fromkeys(
+            normalize_category(category) for category in CATEGORY_LINK.findall(content)
+        )
+    )
+
+
+class WikiArticle:
+    title: str
+    revision: datetime
+    content: str
+    namespace: int
+
+    def __init__(self, title: str, revision: datetime, content: str, namespace: int):
+        self.title = title
+        self.revision = revision
+        self.content = content
+        self.namespace = namespace
+
+    def __str__(self):
+        return f'(Article "{self.title}")'
+
+    def __repr__(self):
+        return f'(Article "{self.title}")'
+
+
+def _prefix_range(prefix: str) -> tuple[str, tuple[str, ...]]:
+    """
+    A condition matching the titles that start with a prefix, as a range on the title index.
+    Titles are compared as UTF-8, which sorts like code points, so the range ends at the prefix with its last character incremented.
+    Where that isn't possible, the range is open-ended, and callers stop at the first title without the prefix.
+    """
+    if not prefix:
+        return "1", ()
+    last = ord(prefix[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        # Surrogates can't be encoded.
+        last = 0xE000
+    if last > 0x10FFFF:
+        return "title >= ?", (prefix,)
+    return "title >= ? AND title < ?", (prefix, prefix[:-1] + chr(last))
+
+
+class ArticleStoreWriter:
+    """
+    Writes an article store. Each article's content is compressed independently and appended to the data file.
+    A new store is written to temporary files which replace any existing store when the writer is closed,
+    so readers never see a partially written store.
+    With `update`, an existing store is modified in place instead: records are appended to its data file,
+    and the index is updated in a single transaction, so an interrupted update leaves the store unchanged.
+    The data file is then compacted if too much of it is taken up by the records of replaced and removed articles.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, update: bool = False):
+        os.makedirs(path, exist_ok=True)
+        self.data_path = join(path, DATA_FILE)
+        self.index_path = join(path, INDEX_FILE)
+        self.update = update
+        if update:
+            self.data = open(self.data_path, "ab")
+            self._original_size = self.data.tell()
+            self.con = sqlite3.connect(self.index_path)
+        else:
+            for tmp_path in [self.data_path + ".tmp", self.index_path + ".tmp"]:
+                if exists(tmp_path):
+                    os.remove(tmp_path)
+            self.data = open(self.data_path + ".tmp", "wb")
+            self.con = sqlite3.connect(self.index_path + ".tmp")
+            self.con.execute("PRAGMA journal_mode = OFF")
+            self.con.execute("PRAGMA synchronous = OFF")
+            self.con.execute(
+                "CREATE TABLE articles (title TEXT PRIMARY KEY, namespace INTEGER, revision TEXT, offset INTEGER, size INTEGER, length INTEGER) WITHOUT ROWID"
+            )
+            self.con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._create_category_index()
+            self._create_redirect_index()
+            self.set_meta("format", str(STORE_FORMAT))
+        self.cctx = zstandard.ZstdCompressor()
+        self.batch_size = batch_size
+        self._batch = []
+        self._category_batch = []
+        self._redirect_batch = []
+        self._removed_batch = []
+        # The revisions of the articles in the batch (None if removed), by title.
+        self._pending: dict[str, str | None] = {}
+        if update and self.get_meta("format") != str(STORE_FORMAT):
+            self._upgrade()
+
+    def _create_category_index(self):
+        # Both directions are covered: category to members by the primary key, and member to categories by the index.
+        self.con.execute(
+            "CREATE TABLE categories (category TEXT, title TEXT, PRIMARY KEY (category, title)) WITHOUT ROWID"
+        )
+        self.con.execute("CREATE INDEX categories_by_title ON categories (title)")
+
+    def _create_redirect_index(self):
+        # Targets are as linked. Resolved targets are the end of the redirect chain, or null if it's broken.
+        self.con.execute(
+            "CREATE TABLE redirects (title TEXT PRIMARY KEY, target TEXT, resolved TEXT) WITHOUT ROWID"
+        )
+        self.con.execute("CREATE INDEX redirects_by_resolved ON redirects (resolved)")
+
+    def _upgrade(self):
+        """Bring a store written in an older format up to date, building the indexes it's missing from its articles."""
+        store_format = int(self.get_meta("format") or 1)
+        if store_format < 2:
+            self._create_category_index()
+        if store_format < 3:
+            self._create_redirect_index()
+        dctx = zstandard.ZstdDecompressor()
+        with open(self.data_path, "rb") as data:
+            for title, offset, size in self.con.execute(
+                "SELECT title, offset, size FROM articles"
+            ).fetchall():
+                data.seek(offset)
+                content = dctx.decompress(data.read(size)).decode()
+                if store_format < 2:
+                    self._category_batch.extend(
+                        (category, title) for category in extract_categories(content)
+                    )
+                if store_format < 3:
+                    self._index_redirect(title, content)
+        self._flush()
+        self.set_meta("format", str(STORE_FORMAT))
+
+    def _index_redirect(self, title: str, content: str):
+        target = redirect_target(content)
+        if target is not None:
+            self._redirect_batch.append((title, target))
+
+    def add(self, article: WikiArticle):
+        """Add an article. If an article with the same title was already added, it is replaced."""
+        record = self.cctx.compress(article.content.encode())
+        offset = self.data.tell()
+        self.data.write(record)
+        self._batch.append(
+            (
+                article.title,
+                article.namespace,
+                article.revision.isoformat(),
+                offset,
+                len(record),
+                len(article.content),
+            )
+        )
+        self._category_batch.extend(
+            (category, article.title)
+            for category in extract_categories(article.content)
+        )
+        self._index_redirect(article.title, article.content)
+        self._pending[article.title] = article.revision.isoformat()
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def remove(self, title: str):
+        if title in self._pending:
+            # Removals are applied before additions, so the addition has to be written first.
+            self._flush()
+        self._removed_batch.append((title,))
+        self._pending[title] = None
+        if len(self._removed_batch) >= self.batch_size:
+            self._flush()
+
+    def revision(self, title: str) -> str | None:
+        """The stored revision of an article, in ISO format, including articles that haven't been written to the index yet."""
+        if title in self._pending:
+            return self._pending[title]
+        row = self.con.execute(
+            "SELECT revision FROM articles WHERE title = ?", (title,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str | None):
+        self.con.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _flush(self):
+        for table in ["articles", "categories", "redirects"]:
+            self.con.executemany(
+                f"DELETE FROM {table} WHERE title = ?", self._removed_batch
+            )
+        # Replaced articles lose their old categories and redirect.
+        self.con.executemany(
+            "DELETE FROM categories WHERE title = ?", ((row[0],) for row in self._batch)
+        )
+        self.con.executemany(
+            "DELETE FROM redirects WHERE title = ?", ((row[0],) for row in self._batch)
+        )
+        self.con.executemany(
+            "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?)", self._batch
+        )
+        self.con.executemany(
+            "INSERT OR IGNORE INTO categories VALUES (?, ?)", self._category_batch
+        )
+        self.con.executemany(
+            "INSERT OR REPLACE INTO redirects VALUES (?, ?, NULL)", self._redirect_batch
+        )
+        self._batch = []
+        self._category_batch = []
+        self._redirect_batch = []
+        self._removed_batch = []
+        self._pending = {}
+
+    def _resolve_redirects(self):
+        """Flatten every redirect chain, so each redirect resolves in one lookup."""
+        targets = dict(self.con.execute("SELECT title, target FROM redirects"))
+        resolved = []
+        for title, target in targets.items():
+            seen = {title}
+            while target in targets and target not in seen:
+                seen.add(target)
+                target = targets[target]
+            if target in seen or self.revision(target) is None:
+                # A loop, or a redirect to a page that doesn't exist.
+                target = None
+            resolved.append((target, title))
+        self.con.executemany("UPDATE redirects SET resolved = ? WHERE title = ?", resolved)
+
+    def close(self):
+        self._flush()
+        # Chains can change with any article, so they're resolved once everything is written.
+        self._resolve_redirects()
+        # Identifies this version of the store, e.g. for data derived from it.
+        self.set_meta("modified", datetime.now().isoformat())
+        # Make sure every record is on disk before the index points to it.
+        self.data.flush()
+        os.fsync(self.data.fileno())
+        data_size = self.data.tell()
+        self.data.close()
+        live_size = self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM articles"
+        ).fetchone()[0]
+        self.con.commit()
+        self.con.close()
+        if not self.update:
+            os.replace(self.data_path + ".tmp", self.data_path)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        elif data_size - live_size > data_size * COMPACT_THRESHOLD:
+            self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the data file with only the records of current articles, and the index with their new offsets.
+        Like a new store, both are written to temporary files which then replace the store.
+        """
+        for tmp_path in [self.data_path + ".tmp", self.index_path + ".tmp"]:
+            if exists(tmp_path):
+                os.remove(tmp_path)
+        shutil.copyfile(self.index_path, self.index_path + ".tmp")
+        con = sqlite3.connect(self.index_path + ".tmp")
+        offsets = []
+        with open(self.data_path, "rb") as data, open(
+            self.data_path + ".tmp", "wb"
+        ) as compacted:
+            # Records are copied in file order, so the old data file is read sequentially.
+            for title, offset, size in con.execute(
+                "SELECT title, offset, size FROM articles ORDER BY offset"
+            ).fetchall():
+                data.seek(offset)
+                offsets.append((compacted.tell(), title))
+                compacted.write(data.read(size))
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        con.executemany("UPDATE articles SET offset = ? WHERE title = ?", offsets)
+        con.commit()
+        con.execute("VACUUM")
+        con.close()
+        os.replace(self.data_path + ".tmp", self.data_path)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def abort(self):
+        self.con.rollback()
+        self.con.close()
+        if self.update:
+            self.data.truncate(self._original_size)
+            self.data.close()
+        else:
+            self.data.close()
+            os.remove(self.data_path + ".tmp")
+            os.remove(self.index_path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ArticleStore(Mapping[str, WikiArticle]):
+    """
+    Read-only, random-access view of an article store, keyed by title.
+    The SQLite index maps titles to the offset of their record in the memory-mapped data file,
+    so looking up an article only reads and decompresses that article.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data_path = join(path, DATA_FILE)
+        self.index_path = join(path, INDEX_FILE)
+        # Stores are opened by ingest threads and read from the main thread.
+        self.con = sqlite3.connect(
+            f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        self.dctx = zstandard.ZstdDecompressor()
+        with open(self.data_path, "rb") as data:
+            if os.fstat(data.fileno()).st_size > 0:
+                self.data = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b""
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return exists(join(path, INDEX_FILE)) and exists(join(path, DATA_FILE))
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _read(self, title, namespace, revision, offset, size) -> WikiArticle:
+        content = self.dctx.decompress(self.data[offset : offset + size]).decode()
+        return WikiArticle(title, datetime.fromisoformat(revision), content, namespace)
+
+    def __getitem__(self, title: str) -> WikiArticle:
+        row = self.con.execute(
+            "SELECT title, namespace, revision, offset, size FROM articles WHERE title = ?",
+            (title,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(title)
+        return self._read(*row)
+
+    def __contains__(self, title: object) -> bool:
+        return (
+            self.con.execute(
+                "SELECT 1 FROM articles WHERE title = ?", (title,)
+            ).fetchone()
+            is not None
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        for (title,) in self.con.execute("SELECT title FROM articles"):
+            yield title
+
+    def __len__(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def items(self, namespace: int | None = None) -> Iterator[tuple[str, WikiArticle]]:  # type: ignore
+        """Every article, or only those in a namespace, without reading the others."""
+        # Read in file order so the data file is scanned sequentially.
+        for row in self.con.execute(
+            "SELECT title, namespace, revision, offset, size FROM articles WHERE ? IS NULL OR namespace = ? ORDER BY offset",
+            (namespace, namespace),
+        ):
+            yield row[0], self._read(*row)
+
+    def values(self) -> Iterator[WikiArticle]:  # type: ignore
+        for _, article in self.items():
+            yield article
+
+    def titles_starting_with(self, prefix: str) -> Iterator[str]:
+        """Titles starting with a prefix, in order. Only the matching range of the title index is read."""
+        condition, parameters = _prefix_range(prefix)
+        for (title,) in self.con.execute(
+            f"SELECT title FROM articles WHERE {condition} ORDER BY title", parameters
+        ):
+            if not title.startswith(prefix):
+                break
+            yield title
+
+    def items_starting_with(self, prefix: str) -> Iterator[tuple[str, WikiArticle]]:
+        """Articles whose titles start with a prefix, in title order."""
+        condition, parameters = _prefix_range(prefix)
+        for row in self.con.execute(
+            f"SELECT title, namespace, revision, offset, size FROM articles WHERE {condition} ORDER BY title",
+            parameters,
+        ):
+            if not row[0].startswith(prefix):
+                break
+            yield row[0], self._read(*row)
+
+    def category_members(
+        self, category: str, exclude_namespaces: Iterable[int] = ()
+    ) -> list[str]:
+        """The titles of the articles in a category, in order."""
+        exclude_namespaces = list(exclude_namespaces)
+        return [
+            title
+            for (title,) in self.con.execute(
+                "SELECT categories.title FROM categories JOIN articles ON articles.title = categories.title "
+                f"WHERE category = ? AND namespace NOT IN ({', '.join('?' * len(exclude_namespaces))}) "
+                "ORDER BY categories.title",
+                (normalize_category(category), *exclude_namespaces),
+            )
+        ]
+
+    def categories(self, title: str) -> list[str]:
+        """The categories an article is in, without the namespace."""
+        return [
+            category
+            for (category,) in self.con.execute(
+                "SELECT category FROM categories WHERE title = ? ORDER BY category",
+                (title,),
+            )
+        ]
+
+    def resolve_redirect(self, title: str) -> str | None:
+        """
+        The title at the end of an article's redirect chain, or the title itself if it isn't a redirect.
+        None if the redirect is broken (it loops or goes to a page that doesn't exist).
+        """
+        row = self.con.execute(
+            "SELECT resolved FROM redirects WHERE title = ?", (title,)
+        ).fetchone()
+        return row[0] if row else title
+
+    def redirects_to(self, title: str, namespace: int | None = None) -> list[str]:
+        """The titles of the redirects that resolve to an article, optionally only those in a namespace, in order."""
+        return [
+            redirect
+            for (redirect,) in self.con.execute(
+                "SELECT redirects.title FROM redirects JOIN articles ON articles.title = redirects.title "
+                "WHERE resolved = ? AND (? IS NULL OR namespace = ?) ORDER BY redirects.title",
+                (title, namespace, namespace),
+            )
+        ]
+
+    def revision(self, title: str) -> str | None:
+        """The revision of an article, in ISO format, without reading the article."""
+        row = self.con.execute(
+            "SELECT revision FROM articles WHERE title = ?", (title,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def content_length(self, title: str) -> int | None:
+        """The length of an article's content, without reading the article."""
+        row = self.con.execute(
+            "SELECT length FROM articles WHERE title = ?", (title,)
+        ).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+from httpx import AsyncClient
+from litellm import get_max_tokens
+import json
+import os
+
+from config import ASYNC_CLIENT, BATCH_API_BASE, BATCH_MAX_OUTPUT_TOKENS
+from response_cache import TRANSPORT_ARGS
+
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+def is_batchable(model: str) -> bool:
+    """Whether a model can be used in Anthropic's Message Batches API."""
+    return model.startswith("anthropic/") or model.startswith("claude")
+
+
+def batch_request(
+    custom_id: str, model: str, messages: list, completion_args: dict[str, Any]
+) -> dict[str, Any]:
+    """A request in a message batch, with the same parameters as a real-time completion."""
+    try:
+        max_tokens = get_max_tokens(model) or BATCH_MAX_OUTPUT_TOKENS
+    except Exception:
+        max_tokens = BATCH_MAX_OUTPUT_TOKENS
+    params = {
+        "model": model.removeprefix("anthropic/"),
+        "max_tokens": max_tokens,
+        "messages": messages,
+    }
+    for name, value in completion_args.items():
+        if name not in TRANSPORT_ARGS:
+            params[name] = value
+    return {"custom_id": custom_id, "params": params}
+
+
+def split_batches(
+    requests: Iterable[dict[str, Any]], max_requests: int, max_bytes: int
+) -> Iterator[list[dict[str, Any]]]:
+    """Split requests into batches of at most `max_requests` requests and `max_bytes` bytes of JSON."""
+    batch = []
+    size = 0
+    for request in requests:
+        # Serialized like the request body, with a separator.
+        request_size = len(json.dumps(request)) + 2
+        if batch and (len(batch) >= max_requests or size + request_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(request)
+        size += request_size
+    if batch:
+        yield batch
+
+
+def message_text(message: dict[str, Any]) -> str | None:
+    text = "".join(
+        block["text"] for block in message.get("content", []) if block["type"] == "text"
+    )
+    return text or None
+
+
+class MessageBatches:
+    """
+    A client for Anthropic's Message Batches API.
+    `api_base` can point to a stand-in server that implements the same endpoints.
+    """
+
+    def __init__(
+        self,
+        api_base: str = BATCH_API_BASE,
+        api_key: str | None = None,
+        client: AsyncClient = ASYNC_CLIENT,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY", "")
+        self.client = client
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": ANTHROPIC_VERSION,
+            "content-type": "application/json",
+        }
+
+    async def create(self, requests: list[dict[str, Any]]) -> dict[str, Any]:
+        response = await self.client.post(
+            f"{self.api_base}/v1/messages/batches",
+            headers=self.headers,
+            json={"requests": requests},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def retrieve(self, batch_id: str) -> dict[str, Any]:
+        response = await self.client.get(
+            f"{self.api_base}/v1/messages/batches/{batch_id}", headers=self.headers
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def results(self, batch: dict[str, Any]) -> list[dict[str, Any]]:
+        """The results of an ended batch, in no particular order."""
+        response = await self.client.get(batch["results_url"], headers=self.headers)
+        response.raise_for_status()
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
@@ -1,45 +1,110 @@
 from __future__ import annotations
 from aiolimiter import AsyncLimiter
 from httpx import AsyncClient
-from litellm import token_counter, completion_cost
-from typing import Iterable, TYPE_CHECKING
+from litellm import token_counter, cost_per_token
+from typing import Callable, Iterable, Iterator, Sequence, TYPE_CHECKING
+from array import array
+from functools import partial
+from itertools import count
+import sys
+import zlib
 
-from config import ASYNC_CLIENT
+from config import ASYNC_CLIENT, COMPRESS_CHARACTER_SECTIONS
 
 if TYPE_CHECKING:
     from source import Source
 
 
 class CharacterId:
-    def __init__(self, source_id: str, name: str):
-        self.source_id = source_id
-        self.name = name
+    """
+    Identifies a character. Ids are interned: creating an id that already exists returns the existing object,
+    so ids compare by identity and their hash is computed once.
+    Each id also has an integer `handle`, unique within the process, for compact lookup tables.
+    """
+
+    __slots__ = ("source_id", "name", "handle", "_hash", "_str")
+
+    source_id: str
+    name: str
+    handle: int
+
+    _interned: dict[tuple[str, str], CharacterId] = {}
+    _interned_strs: dict[str, CharacterId] = {}
+    _handles: dict[int, CharacterId] = {}
+    _next_handle = count()
+
+    def __new__(cls, source_id: str, name: str):
+        character_id = cls._interned.get((source_id, name))
+        if character_id is not None:
+            return character_id
+        character_id = super().__new__(cls)
+        character_id.source_id = source_id
+        character_id.name = name
+        character_id._str = f"{source_id}/{name}"
+        character_id._hash = hash(character_id._str)
+        character_id.handle = next(cls._next_handle)
+        # Another thread may have interned the same id first.
+        interned = cls._interned.setdefault((source_id, name), character_id)
+        if interned is character_id:
+            cls._handles[character_id.handle] = character_id
+        return interned
+
+    def __reduce__(self):
+        # Unpickled ids are interned too.
+        return (CharacterId, (self.source_id, self.name))
 
     def __str__(self):
-        return f"{self.source_id}/{self.name}"
+        return self._str
 
     def __repr__(self):
-        return str(self)
+        return self._str
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
-        if isinstance(other, CharacterId):
-            return self.source_id == other.source_id and self.name == other.name
-        else:
-            return False
+        # Interned, so equal ids are the same object.
+        return self is other
+
+    @staticmethod
+    def from_str(s: str) -> CharacterId:
+        character_id = CharacterId._interned_strs.get(s)
+        if character_id is None:
+            character_id = CharacterId(s[: s.index("/")], s[s.index("/") + 1 :])
+            CharacterId._interned_strs[s] = character_id
+        return character_id
 
     @staticmethod
-    def from_str(s: str):
-        return CharacterId(s[: s.index("/")], s[s.index("/") + 1 :])
+    def from_handle(handle: int) -> CharacterId:
+        return CharacterId._handles[handle]
 
 
 class Section:
-    def __init__(self, text: str, priority: float):
-        self.text = text
+    """
+    A section of a character's article. The text can be given as a function that converts it,
+    which is only called the first time the text is needed (e.g. never for sections left out of abridged text).
+    """
+
+    __slots__ = ("_text", "priority")
+
+    def __init__(self, text: str | Callable[[], str], priority: float):
+        self._text = text
         self.priority = priority
 
+    @property
+    def converted(self) -> bool:
+        return not callable(self._text)
+
+    @property
+    def text(self) -> str:
+        if callable(self._text):
+            self._text = self._text()
+        return self._text
+
+    @text.setter
+    def text(self, text: str):
+        self._text = text
+
     @staticmethod
     def combine_sections(sections: Iterable[Section]):
         return "\n".join([section.text for section in sections])
@@ -51,12 +116,166 @@ class Section:
         return f'(Section "{self.text.strip().splitlines()[0][0:100]}")'
 
 
+class CompactSections(Sequence[Section]):
+    """
+    A character's sections, stored compactly: converted texts share one UTF-8 buffer (compressed if `compress`),
+    indexed by offset and priority arrays. Sections that haven't been converted yet keep their conversion until it's needed.
+    Sections are read-only; indexing and iterating create new `Section` objects.
+    """
+
+    __slots__ = (
+        "_buffer",
+        "_offsets",
+        "_priorities",
+        "_pending",
+        "_compressed",
+        "_token_counts",
+    )
+
+    def __init__(
+        self, sections: Iterable[Section], compress: bool = COMPRESS_CHARACTER_SECTIONS
+    ):
+        texts: list[bytes] = []
+        offsets = [0]
+        priorities = []
+        # Conversions (or their results, once called) of the sections that weren't converted, by index.
+        self._pending: dict[int, str | Callable[[], str]] | None = None
+        for i, section in enumerate(sections):
+            priorities.append(section.priority)
+            if section.converted:
+                texts.append(section.text.encode())
+                offsets.append(offsets[-1] + len(texts[-1]))
+            else:
+                if self._pending is None:
+                    self._pending = {}
+                self._pending[i] = section._text
+                offsets.append(offsets[-1])
+        # Token counts of each section (-1 until counted), by model.
+        self._token_counts: dict[str, array] | None = None
+        self._offsets = array("q", offsets)
+        self._priorities = array("d", priorities)
+        buffer = b"".join(texts)
+        self._compressed = compress
+        # zlib rather than zstandard, whose output keeps the allocation of the worst-case compressed size.
+        self._buffer = zlib.compress(buffer) if compress else buffer
+
+    def decompressed(self) -> bytes:
+        """The converted texts, decompressed. Pass it to `text` when reading several sections, so they're decompressed once."""
+        return zlib.decompress(self._buffer) if self._compressed else self._buffer
+
+    def text(self, i: int, buffer: bytes | None = None) -> str:
+        if self._pending is not None and i in self._pending:
+            text = self._pending[i]
+            if callable(text):
+                text = self._pending[i] = text()
+            return text
+        if buffer is None:
+            buffer = self.decompressed()
+        return buffer[self._offsets[i] : self._offsets[i + 1]].decode()
+
+    def texts(self, indices: Iterable[int]) -> list[str]:
+        """The texts of several sections, decompressed once."""
+        buffer = self.decompressed()
+        return [self.text(i, buffer) for i in indices]
+
+    def token_count(self, i: int, model: str, buffer: bytes | None = None) -> int:
+        """The number of tokens in a section for a model's tokenizer, counted once."""
+        if self._token_counts is None:
+            self._token_counts = {}
+        counts = self._token_counts.get(model)
+        if counts is None:
+            counts = self._token_counts[model] = array("q", [-1]) * len(self)
+        if counts[i] < 0:
+            counts[i] = token_counter(model, text=self.text(i, buffer))
+        return counts[i]
+
+    def token_counts(self, indices: Iterable[int], model: str) -> list[int]:
+        """The token counts of several sections, decompressing them at most once."""
+        buffer = None
+        counts = []
+        for i in indices:
+            if buffer is None and (
+                self._token_counts is None
+                or model not in self._token_counts
+                or self._token_counts[model][i] < 0
+            ):
+                buffer = self.decompressed()
+            counts.append(self.token_count(i, model, buffer))
+        return counts
+
+    def _section(self, i: int, buffer: bytes) -> Section:
+        if self._pending is not None and callable(self._pending.get(i)):
+            return Section(partial(self.text, i), self._priorities[i])
+        return Section(self.text(i, buffer), self._priorities[i])
+
+    @property
+    def nbytes(self) -> int:
+        """An estimate of the memory the sections hold."""
+        size = (
+            sys.getsizeof(self)
+            + sys.getsizeof(self._buffer)
+            + sys.getsizeof(self._offsets)
+            + sys.getsizeof(self._priorities)
+        )
+        if self._pending is not None:
+            size += sys.getsizeof(self._pending)
+            for text in self._pending.values():
+                # Conversions are partials holding their wikitext.
+                arguments = getattr(text, "args", (text,))
+                size += sum(sys.getsizeof(argument) for argument in arguments)
+        if self._token_counts:
+            size += sys.getsizeof(self._token_counts) + sum(
+                sys.getsizeof(counts) for counts in self._token_counts.values()
+            )
+        else:
+            # Reserve a model's counts, which are added once the sections are counted.
+            size += sys.getsizeof(array("q")) + array("q").itemsize * len(self)
+        return size
+
+    @property
+    def priorities(self) -> array:
+        return self._priorities
+
+    def __len__(self) -> int:
+        return len(self._priorities)
+
+    def __getitem__(self, i: int) -> Section:  # type: ignore
+        if isinstance(i, slice):
+            buffer = self.decompressed()
+            return [self._section(j, buffer) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._section(i, self.decompressed())
+
+    def __iter__(self) -> Iterator[Section]:
+        # Decompress once for every section.
+        buffer = self.decompressed()
+        for i in range(len(self)):
+            yield self._section(i, buffer)
+
+
+def abridgement_order(priorities: Sequence[float]) -> list[int]:
+    """
+    The indices of the sections that can be included in abridged text, from most to least important.
+    The least important sections are left out first, earliest first.
+    """
+    return sorted(
+        (i for i, priority in enumerate(priorities) if priority > 0),
+        key=lambda i: (priorities[i], i),
+        reverse=True,
+    )
+
+
 class Character:
+    __slots__ = ("id", "revision", "source", "aliases", "_sections")
+
     def __init__(
         self,
         id: CharacterId,
         revision: str,
-        sections: list[Section] | None,
+        sections: Iterable[Section] | None,
         source: Source | None,
         aliases: list[str] | None = None,
     ):
@@ -66,6 +285,25 @@ class Character:
         self.source = source
         self.aliases = aliases or []
 
+    @property
+    def sections(self) -> CompactSections | None:
+        return self._sections
+
+    @sections.setter
+    def sections(self, sections: Iterable[Section] | None):
+        if sections is None or isinstance(sections, CompactSections):
+            self._sections = sections
+        else:
+            self._sections = CompactSections(sections)
+
+    @property
+    def nbytes(self) -> int:
+        """An estimate of the memory the character holds."""
+        size = sys.getsizeof(self) + sum(sys.getsizeof(alias) for alias in self.aliases)
+        if self._sections is not None:
+            size += self._sections.nbytes
+        return size
+
     @property
     def full_text(self):
         if self.sections is None:
@@ -81,24 +319,87 @@ class Character:
     ) -> str:
         if self.sections is None:
             raise ValueError("Character was initialized without sections.")
-        abridged_sections = [
-            section for section in self.sections if section.priority > 0
-        ]
-        text = Section.combine_sections(abridged_sections)
-        if (max_tokens != None or max_tokens != None) and not model:
+        buffer = self.sections.decompressed()
+        sections = self.abridged_sections(
+            model, max_characters, max_tokens, max_cost, buffer
+        )
+        return "\n".join(self.sections.text(i, buffer) for i in sections)
+
+    def abridged_sections(
+        self,
+        model: str | None = None,
+        max_characters: int | None = None,
+        max_tokens: int | None = None,
+        max_cost: float | None = None,
+        buffer: bytes | None = None,
+    ) -> list[int]:
+        """The indices of the sections in the abridged text, in order. `buffer` is the sections' decompressed texts, if already decompressed."""
+        if self.sections is None:
+            raise ValueError("Character was initialized without sections.")
+        if buffer is None:
+            buffer = self.sections.decompressed()
+        if (max_tokens != None or max_cost != None) and not model:
             raise Exception(
                 "No model provided, but one is required for max_tokens and max_cost."
             )
-        while (
-            (max_characters != None and len(text) > max_characters)
-            or (max_tokens != None and token_counter(model, text=text) > max_tokens)  # type: ignore
-            or (max_cost != None and completion_cost(model, prompt=text) > max_cost)  # type: ignore
-        ):
-            abridged_sections.remove(
-                min(abridged_sections, key=lambda section: section.priority)
+        kept = abridgement_order(self.sections.priorities)
+        if max_characters != None:
+            # Add sections in order of importance until the text is too long, so the rest are never converted.
+            length = -1
+            for count, i in enumerate(kept):
+                length += len(self.sections.text(i, buffer)) + 1
+                if length > max_characters:
+                    kept = kept[:count]
+                    break
+        if max_tokens != None or max_cost != None:
+            kept = kept[: self._token_budget_count(kept, model, max_tokens, max_cost, buffer)]  # type: ignore
+        return sorted(kept)
+
+    def _token_budget_count(
+        self,
+        kept: list[int],
+        model: str,
+        max_tokens: int | None,
+        max_cost: float | None,
+        buffer: bytes,
+    ) -> int:
+        """The number of the most important sections whose text is within the token and cost limits."""
+        sections: CompactSections = self.sections  # type: ignore
+
+        def within_limits(tokens: int) -> bool:
+            return (max_tokens == None or tokens <= max_tokens) and (
+                max_cost == None
+                or cost_per_token(model=model, prompt_tokens=tokens)[0] <= max_cost
             )
-            text = Section.combine_sections(abridged_sections)
-        return text
+
+        def fits(count: int) -> bool:
+            text = "\n".join(sections.text(i, buffer) for i in sorted(kept[:count]))
+            return within_limits(token_counter(model, text=text))
+
+        # Estimate the count from each section's (cached) token count.
+        count = 0
+        tokens = 0
+        next_tokens = 0
+        for i in kept:
+            next_tokens = tokens + sections.token_count(i, model, buffer)
+            if not within_limits(next_tokens):
+                break
+            tokens = next_tokens
+            count += 1
+        # Joining sections only changes the tokens where they meet, by a token or so on each side.
+        # Unless the estimate is that close to the limits, it's right; otherwise check the actual text around it.
+        if within_limits(tokens + 2 * count) and (
+            count == len(kept) or not within_limits(next_tokens - 2 * (count + 1))
+        ):
+            return count
+        if fits(count):
+            while count < len(kept) and fits(count + 1):
+                count += 1
+        else:
+            count = max(count - 1, 0)
+            while count > 0 and not fits(count):
+                count -= 1
+        return count
 
     @property
     def name(self) -> str:
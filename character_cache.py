@@ -0,0 +1,77 @@
+from __future__ import annotations
+from collections import OrderedDict
+from character import Character, CharacterId
+
+
+class CharacterCache:
+    """
+    Characters kept in memory, evicting the least recently used once their estimated size exceeds `max_bytes`.
+    A character with sections also serves requests for the meta-only character.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Characters and their estimated size, least recently used first.
+        self._characters: OrderedDict[CharacterId, tuple[Character, int]] = OrderedDict()
+
+    def get(self, character_id: CharacterId, meta_only: bool = False) -> Character | None:
+        entry = self._characters.get(character_id)
+        if entry is None or (not meta_only and entry[0].sections is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._characters.move_to_end(character_id)
+        character, size = entry
+        # Characters grow as their sections are converted and counted, so they're measured again when they're used.
+        new_size = character.nbytes
+        if new_size != size:
+            self._characters[character_id] = (character, new_size)
+            self.size += new_size - size
+            self._evict()
+        return character
+
+    def add(self, character: Character):
+        entry = self._characters.get(character.id)
+        if (
+            entry is not None
+            and character.sections is None
+            and entry[0].sections is not None
+        ):
+            # Keep the full character, which serves meta-only requests too.
+            self._characters.move_to_end(character.id)
+            return
+        size = character.nbytes
+        if size > self.max_bytes:
+            return
+        if entry is not None:
+            self.size -= entry[1]
+        self._characters[character.id] = (character, size)
+        self._characters.move_to_end(character.id)
+        self.size += size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._characters.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._characters.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._characters)
+
+    def __str__(self):
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0
+        return (
+            f"Character cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{self.evictions} evictions, {len(self)} characters "
+            f"({self.size / 1024 / 1024:.1f} of {self.max_bytes / 1024 / 1024:.0f} MiB)"
+        )
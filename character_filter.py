@@ -276,24 +276,86 @@ class RatingFilter(CharacterFilter):
 
 @CHARACTER_FILTER_TYPE_REGISTRAR.register("length")
 class LengthFilter(CharacterFilter):
-    """Matches characters based on their abridged article length."""
+    """Matches characters based on their article length, or their abridged text's length with `abridged`."""
 
-    def __init__(self, threshold: float):
+    def __init__(self, threshold: float, abridged: bool = False):
         self.threshold = threshold
+        self.abridged = abridged
 
     def ok(self, character_id: CharacterId, source_manager: SourceManager):
-        # Hopefully this is cached.
+        # Read from the source's manifest when it has one.
         return (
-            source_manager.get_character_length_estimate(character_id) >= self.threshold
+            source_manager.get_character_length_estimate(
+                character_id, abridged=self.abridged
+            )
+            >= self.threshold
         )
 
     @property
     def parameters(self):
-        return {"threshold": self.threshold}
+        return {"threshold": self.threshold, "abridged": self.abridged}
 
     @staticmethod
     def from_parameters(
         parameters: dict[str, Any],
         registrar: TypeRegistrar[CharacterFilter],
     ):
-        raise NotImplementedError("Cannot construct a RatingFilter without ratings.")
+        return LengthFilter(parameters["threshold"], parameters.get("abridged", False))
+
+
+@CHARACTER_FILTER_TYPE_REGISTRAR.register("universe")
+class UniverseFilter(CharacterFilter):
+    """Matches characters from specific universes (e.g. Marvel realities like Earth-616)."""
+
+    universes: set[str]
+
+    def __init__(self, *universes: str):
+        self.universes = set(universes)
+
+    def ok(self, character_id: CharacterId, source_manager: SourceManager):
+        return source_manager.get_character_universe(character_id) in self.universes
+
+    @property
+    def parameters(self):
+        return {"universes": list(self.universes)}
+
+    @staticmethod
+    def from_parameters(
+        parameters: dict[str, Any], registrar: TypeRegistrar[CharacterFilter]
+    ) -> UniverseFilter:
+        return UniverseFilter(*parameters["universes"])
+
+
+@CHARACTER_FILTER_TYPE_REGISTRAR.register("category")
+class CategoryFilter(CharacterFilter):
+    """Matches characters in any of the given categories (e.g. "Villains"), for sources with categories."""
+
+    categories: set[str]
+
+    def __init__(self, *categories: str):
+        self.categories = set(categories)
+        # The members of the categories, per source, read from the source's category index the first time they're needed.
+        self._members: dict[str, set[CharacterId]] = {}
+
+    def ok(self, character_id: CharacterId, source_manager: SourceManager):
+        members = self._members.get(character_id.source_id)
+        if members is None:
+            members = set()
+            for category in self.categories:
+                members.update(
+                    source_manager.get_characters_in_category(
+                        character_id.source_id, category
+                    )
+                )
+            self._members[character_id.source_id] = members
+        return character_id in members
+
+    @property
+    def parameters(self):
+        return {"categories": list(self.categories)}
+
+    @staticmethod
+    def from_parameters(
+        parameters: dict[str, Any], registrar: TypeRegistrar[CharacterFilter]
+    ) -> CategoryFilter:
+        return CategoryFilter(*parameters["categories"])
@@ -1,5 +1,6 @@
 import litellm
 from os.path import join, dirname
+import os
 from dotenv import load_dotenv
 import httpx
 
@@ -32,24 +33,70 @@ DB_PATH = join(PROJECT_ROOT, "runs.sqlite")
 # Whether to keep the original downloads (used for Mediawiki wikis)
 KEEP_ORIGINAL_DOWNLOADS = False
 
+# Dump parsing
+PARSE_PROCESSES = None  # Number of processes used to parse dumps. None uses every core; 1 parses serially.
+PARSE_CHUNK_SIZE = 16 * 1024 * 1024  # Size (in bytes) of the page-aligned chunks handed to each process.
+PIPELINE_BUFFER_CHUNKS = 64  # Chunks buffered between the download, decompression and parsing stages.
+
+# Whether to cache processed characters on disk (invalidated when the article or the processing code changes)
+CACHE_PROCESSED_CHARACTERS = True
+PROCESSED_CHARACTER_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # Least recently used characters are evicted past this size.
+PROCESSED_CHARACTER_CACHE_MAX_AGE = 90 * 24 * 60 * 60  # Seconds before an unused character is evicted.
+
+# Batch character extraction
+CHARACTER_PROCESSES = None  # Number of processes used to extract characters in batches. None uses every core; 1 extracts serially.
+CHARACTER_CHUNK_SIZE = 32  # Characters handed to a process at a time.
+
+# Whether to build a manifest of character metadata (validity, lengths, aliases, image, universe) when a source is loaded without an up-to-date one.
+# Building extracts every character, so it takes a while for large wikis (later builds reuse the processed character cache).
+# Otherwise, manifests are only built on request (MediaWiki.update_manifest), and loaded while they're up to date.
+BUILD_MANIFEST = False
+MANIFEST_BATCH_SIZE = 5000  # Characters extracted per batch while building a manifest.
+
+# How wikitext sections are converted to plain text (sources can override this).
+# "fast" uses a purpose-built converter, falling back to wikitextparser for wikitext it doesn't support, with the same output.
+# "wikitextparser" always uses wikitextparser.
+PLAIN_TEXT_CONVERTER = "fast"
+
+# Whether characters keep their section texts compressed in memory.
+# Several times smaller, for one decompression (about a millisecond for 400 KB of text) each time a character's text is read.
+COMPRESS_CHARACTER_SECTIONS = True
+
+# Memory budget (in bytes, estimated) for the characters a run keeps in memory. The least recently used are evicted first.
+CHARACTER_CACHE_BYTES = 1024 * 1024 * 1024
+
 # Per-character limits
 MAX_CHARACTERS = 100000
 MAX_TOKENS = None
 MAX_COST = None
+DESCRIPTION_CACHE_SIZE = 8192  # Abridged descriptions kept for reuse across matches.
 
 # How often to print the running cost in a run
 COST_UPDATE_INTERVAL = 0.10
 
-# For rate limiting
-TOKEN_LIMITED = True  # If true, rate limits based on tokens. If false, rate limits based on requests.
+# For rate limiting (rate_limit.RateLimit enforces both limits; None disables either)
 TOKENS_PER_INTERVAL = 200000
 REQUESTS_PER_INTERVAL = 1000
 INTERVAL_SECS = 60
 MAX_OUTPUT_TOKENS_ESTIMATE = 0  # Used when a model isn't known to LiteLLM.
-EXECUTE_DELAY = 0.5  # To control "bursts"
+EXECUTE_DELAY = None  # Minimum seconds between requests, to control "bursts". Any delay caps requests at 60 / EXECUTE_DELAY a minute.
 
 NUM_RETRIES = 10
 
+# Whether to cache model responses, so identical prompts (e.g. re-running evals or resuming a run) are only paid for once.
+CACHE_RESPONSES = False
+RESPONSE_CACHE_PATH = join(PROJECT_ROOT, "responses.sqlite")
+RESPONSE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Least recently used responses are evicted past this size.
+RESPONSE_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # Seconds before a response expires.
+
+# Batch execution with Anthropic's Message Batches API (Run.start_batch), for runs that can wait for results.
+BATCH_API_BASE = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com")  # Can point to a stand-in server.
+BATCH_MAX_REQUESTS = 10000  # Matches submitted per batch.
+BATCH_MAX_BYTES = 200 * 1024 * 1024  # Size of a batch's requests, with room under the API's 256 MB limit.
+BATCH_POLL_SECS = 60  # How often to check whether batches have ended.
+BATCH_COST_FACTOR = 0.5  # Batches are billed at half the real-time price.
+BATCH_MAX_OUTPUT_TOKENS = 4096  # Used when a model isn't known to LiteLLM.
+
 
 # Prompt
 PROMPT = "prompt_end.toml"
@@ -66,6 +66,19 @@ class RunsDatabase:
                 raise DbFormatMismatchException(format)
         except sqlite3.OperationalError:
             pass
+        if self.initialized:
+            self._create_batch_tables()
+
+    def _create_batch_tables(self):
+        # Added after format 1 without changing how anything else is stored, so they're created as needed.
+        cur = self.con.cursor()
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS batches (batch_id TEXT PRIMARY KEY, run_id INTEGER, model TEXT, batch_status INT, batch_start TEXT, FOREIGN KEY(run_id) REFERENCES runs(run_id))"
+        )
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS batch_matches (batch_id TEXT, match_id INTEGER, FOREIGN KEY(batch_id) REFERENCES batches(batch_id), FOREIGN KEY(match_id) REFERENCES matches(match_id))"
+        )
+        self.con.commit()
 
     def initialize_db(self):
         cur = self.con.cursor()
@@ -81,6 +94,7 @@ class RunsDatabase:
             (DB_FORMAT,),
         )
         self.con.commit()
+        self._create_batch_tables()
 
     def start_run(self, run: Run) -> RunID:
         cur = self.con.cursor()
@@ -225,6 +239,41 @@ class RunsDatabase:
         self.con.commit()
         return cur.lastrowid  # type: ignore
 
+    def start_batch(
+        self, batch_id: str, run_id: RunID, model: str, match_ids: list[MatchID]
+    ):
+        """Record a batch of a run's matches submitted to a provider, so the run can collect its results after a restart."""
+        cur = self.con.cursor()
+        cur.execute(
+            "INSERT INTO batches VALUES (?, ?, ?, 0, ?)",
+            (batch_id, run_id, model, str(datetime.now())),
+        )
+        cur.executemany(
+            "INSERT INTO batch_matches VALUES (?, ?)",
+            [(batch_id, match_id) for match_id in match_ids],
+        )
+        self.con.commit()
+
+    def end_batch(self, batch_id: str):
+        """Mark a batch's results as recorded."""
+        cur = self.con.cursor()
+        cur.execute("UPDATE batches SET batch_status = 1 WHERE batch_id = ?", (batch_id,))
+        self.con.commit()
+
+    def get_pending_batches(self, run_id: RunID) -> dict[str, tuple[str, list[MatchID]]]:
+        """The model and matches of each of a run's batches whose results haven't been recorded, by batch ID."""
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT batches.batch_id, model, match_id FROM batches JOIN batch_matches ON batches.batch_id = batch_matches.batch_id WHERE run_id = ? AND batch_status = 0",
+            (run_id,),
+        )
+        batches: dict[str, tuple[str, list[MatchID]]] = {}
+        for row in cur.fetchall():
+            batches.setdefault(row["batch_id"], (row["model"], []))[1].append(
+                row["match_id"]
+            )
+        return batches
+
     class ResultsFilters(TypedDict):
         include_dry: bool | None
         run_id: RunID | None
@@ -290,12 +339,22 @@ class RunsDatabase:
             match_filter_type_registrar,
         )
         results = list(self.get_results(run_id=row["run_id"], outcome="finished"))
+        unfinished = list(self.get_results(run_id=row["run_id"], outcome="unfinished"))
+        # Extract the characters in one batch, so reprepare only hits the cache.
+        source_manager.get_characters(
+            [
+                character_id
+                for result in unfinished
+                for character_id in (result.character_a.id, result.character_b.id)
+            ],
+            return_exceptions=True,
+        )
         remaining_matches = [
             result.reprepare(
                 self if include_db else None,
                 source_manager,
             )
-            for result in self.get_results(run_id=row["run_id"], outcome="unfinished")
+            for result in unfinished
         ]
         return Run(
             row["run_name"],
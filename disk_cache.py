@@ -0,0 +1,113 @@
+from __future__ import annotations
+from typing import Any
+from hashlib import sha256
+import os
+from os.path import dirname
+import pickle
+import sqlite3
+import time
+import zstandard
+
+
+def content_key(*parts: Any) -> str:
+    """Hash the parts of a key into a fixed-length content address."""
+    return sha256("\0".join(str(part) for part in parts).encode()).hexdigest()
+
+
+# Entries written between evictions.
+EVICTION_INTERVAL = 1000
+
+# How stale (in seconds) an entry's last use can be before reading it records a new one, to avoid a write per read.
+USE_RESOLUTION = 60 * 60
+
+
+class DiskCache:
+    """
+    A persistent key-value cache stored in SQLite, safe to share between processes.
+    Values are pickled and compressed.
+    Entries that haven't been used for `max_age` seconds are deleted, then the least recently used once the cache is larger than `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int | None = None, max_age: float | None = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._con = None
+        self._writes = 0
+        self.cctx = zstandard.ZstdCompressor()
+        self.dctx = zstandard.ZstdDecompressor()
+
+    @property
+    def con(self) -> sqlite3.Connection:
+        # Connect lazily, so caches can be created in one process and used in another.
+        if self._con is None:
+            os.makedirs(dirname(self.path), exist_ok=True)
+            self._con = sqlite3.connect(self.path, timeout=60)
+            self._con.execute("PRAGMA journal_mode = WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, used REAL)"
+            )
+            columns = [row[1] for row in self._con.execute("PRAGMA table_info(entries)")]
+            if "used" not in columns:
+                # Caches written before eviction count as used now.
+                self._con.execute("ALTER TABLE entries ADD COLUMN used REAL")
+                self._con.execute("UPDATE entries SET used = ?", (time.time(),))
+            self._con.execute("CREATE INDEX IF NOT EXISTS entries_by_used ON entries (used)")
+            self._con.commit()
+            self.evict()
+        return self._con
+
+    def get(self, key: str) -> Any | None:
+        row = self.con.execute(
+            "SELECT value, used FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now - USE_RESOLUTION:
+            self.con.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+            self.con.commit()
+        return pickle.loads(self.dctx.decompress(row[0]))
+
+    def set(self, key: str, value: Any):
+        self.con.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+            (key, self.cctx.compress(pickle.dumps(value)), time.time()),
+        )
+        self.con.commit()
+        self._writes += 1
+        if self._writes % EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def delete(self, key: str):
+        self.con.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.con.commit()
+
+    def evict(self):
+        """Delete entries unused for `max_age` seconds, then the least recently used until the cache fits in `max_bytes`."""
+        if self.max_age is not None:
+            self.con.execute(
+                "DELETE FROM entries WHERE used < ?", (time.time() - self.max_age,)
+            )
+        if self.max_bytes is not None:
+            size = self.con.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+            ).fetchone()[0]
+            if size > self.max_bytes:
+                evicted = 0
+                keys = []
+                for key, length in self.con.execute(
+                    "SELECT key, LENGTH(value) FROM entries ORDER BY used"
+                ):
+                    if size - evicted <= self.max_bytes:
+                        break
+                    keys.append((key,))
+                    evicted += length
+                self.con.executemany("DELETE FROM entries WHERE key = ?", keys)
+        self.con.commit()
+
+    def __getstate__(self):
+        return {"path": self.path, "max_bytes": self.max_bytes, "max_age": self.max_age}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["max_bytes"], state["max_age"])
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from aiolimiter import AsyncLimiter
+from collections import OrderedDict
 from jinja2 import FileSystemLoader, Environment, BaseLoader
 from config import *
 from character import Character, CharacterId
@@ -32,6 +33,8 @@ from typing import Any, cast, TYPE_CHECKING
 import random
 
 from match import MatchSettings
+from response_cache import ResponseCache
+from rate_limit import RateLimit
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +49,7 @@ class Evaluator:
         stop: list[str] = [],
         information_file: str = INFORMATION_FILE,
         information_raw: dict | None = None,
+        cache_responses: bool = CACHE_RESPONSES,
     ):
         prompt_id = None
         prompt_version = None
@@ -80,6 +84,26 @@ class Evaluator:
         self.information_id = information_id
         self.information_version = information_version
         self.information_file = information_file
+        # Abridged descriptions, least recently used first, keyed by character, revision, model and limits.
+        # Each is kept with the indices of the sections in it.
+        self._descriptions: OrderedDict[
+            tuple[CharacterId, str, str, int | None, int | None, float | None],
+            tuple[str, list[int]],
+        ] = OrderedDict()
+        self.description_cache_size = DESCRIPTION_CACHE_SIZE
+        self.description_hits = 0
+        self.description_misses = 0
+        # Names shown in prompts, keyed by character and whether they include the franchise.
+        self._display_names: dict[tuple[CharacterId, bool], str] = {}
+        # Tokens in the prompt besides the characters' names and descriptions, keyed by model and sources.
+        self._template_tokens: dict[tuple[str, str, str], int] = {}
+        self.response_cache = (
+            ResponseCache(
+                RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_AGE
+            )
+            if cache_responses
+            else None
+        )
 
     def to_object(self):
         return {
@@ -119,33 +143,157 @@ class Evaluator:
         max_tokens: int | None = MAX_TOKENS,
         max_cost: float | None = MAX_COST,
     ) -> str:
-        if character_a.id.source_id == character_b.source_id:
-            character_a_name = character_a.name
-            character_b_name = character_b.name
-        else:
-            character_a_name = f"{character_a.name} ({self.information[character_a.source_id]['name']})"
-            character_b_name = f"{character_b.name} ({self.information[character_b.source_id]['name']})"
-        character_a_description = character_a.abridged_text(
-            model, max_characters, max_tokens, max_cost
+        with_franchise = character_a.source_id != character_b.source_id
+        character_a_name = self.display_name(character_a, with_franchise)
+        character_b_name = self.display_name(character_b, with_franchise)
+        character_a_description = self.describe(
+            character_a, model, max_characters, max_tokens, max_cost
         )
-        character_b_description = character_b.abridged_text(
-            model, max_characters, max_tokens, max_cost
+        character_b_description = self.describe(
+            character_b, model, max_characters, max_tokens, max_cost
         )
+        return self._render(
+            character_a_name,
+            character_a_description,
+            character_a.source_id,
+            character_b_name,
+            character_b_description,
+            character_b.source_id,
+        )
+
+    def _render(
+        self,
+        character_a_name: str,
+        character_a_description: str,
+        source_a: str,
+        character_b_name: str,
+        character_b_description: str,
+        source_b: str,
+    ) -> str:
         return self.template.render(
             {
                 "character_a": {
                     "name": character_a_name,
                     "description": character_a_description,
                 },
-                "franchise_a": self.information[character_a.source_id],
+                "franchise_a": self.information[source_a],
                 "character_b": {
                     "name": character_b_name,
                     "description": character_b_description,
                 },
-                "franchise_b": self.information[character_b.source_id],
+                "franchise_b": self.information[source_b],
             }
         )
 
+    def display_name(self, character: Character, with_franchise: bool) -> str:
+        key = (character.id, with_franchise)
+        name = self._display_names.get(key)
+        if name is None:
+            name = (
+                self._full_name(character.name, character.source_id)
+                if with_franchise
+                else character.name
+            )
+            self._display_names[key] = name
+        return name
+
+    def describe(
+        self,
+        character: Character,
+        model: str = MODEL,
+        max_characters: int | None = MAX_CHARACTERS,
+        max_tokens: int | None = MAX_TOKENS,
+        max_cost: float | None = MAX_COST,
+    ) -> str:
+        """A character's abridged text, reused by every match the same revision is in."""
+        return self._description(character, model, max_characters, max_tokens, max_cost)[0]
+
+    def _description(
+        self,
+        character: Character,
+        model: str,
+        max_characters: int | None,
+        max_tokens: int | None,
+        max_cost: float | None,
+        count: bool = True,
+    ) -> tuple[str, list[int]]:
+        """A character's description and the sections in it. Lookups that aren't `count`ed are left out of the hit rate."""
+        key = (character.id, character.revision, model, max_characters, max_tokens, max_cost)
+        description = self._descriptions.get(key)
+        if description is not None:
+            self.description_hits += count
+            self._descriptions.move_to_end(key)
+            return description
+        self.description_misses += count
+        sections = character.abridged_sections(model, max_characters, max_tokens, max_cost)
+        description = (
+            "\n".join(character.sections.texts(sections)),  # type: ignore
+            sections,
+        )
+        self._descriptions[key] = description
+        while len(self._descriptions) > self.description_cache_size:
+            self._descriptions.popitem(last=False)
+        return description
+
+    def prompt_tokens(
+        self,
+        character_a: Character,
+        character_b: Character,
+        model: str = MODEL,
+        max_characters: int | None = MAX_CHARACTERS,
+        max_tokens: int | None = MAX_TOKENS,
+        max_cost: float | None = MAX_COST,
+    ) -> int:
+        """
+        An estimate of the tokens in a match's prompt, from the token counts of the sections in each description
+        (counted once per character, often while abridging) and of the rest of the template.
+        """
+        key = (model, character_a.source_id, character_b.source_id)
+        if key not in self._template_tokens:
+            self._template_tokens[key] = token_counter(
+                model=model,
+                text=self._render(
+                    "", "", character_a.source_id, "", "", character_b.source_id
+                ),
+            )
+        tokens = self._template_tokens[key]
+        for character in (character_a, character_b):
+            # Usually the description the prompt was just formatted with, so it's not counted again.
+            _, sections = self._description(
+                character, model, max_characters, max_tokens, max_cost, count=False
+            )
+            # Each section, and the line breaks between them.
+            tokens += sum(character.sections.token_counts(sections, model))  # type: ignore
+            tokens += max(len(sections) - 1, 0)
+        return tokens
+
+    @property
+    def description_cache_stats(self) -> str:
+        requests = self.description_hits + self.description_misses
+        hit_rate = self.description_hits / requests if requests else 0
+        return (
+            f"Description cache: {self.description_hits} hits, "
+            f"{self.description_misses} misses ({hit_rate:.0%} hit rate)"
+        )
+
+    @staticmethod
+    def messages(prompt_text: str) -> list[dict[str, str]]:
+        return [
+            {
+                "role": "user",
+                "content": prompt_text,
+            },
+        ]
+
+    def match_settings(self, model: str = MODEL) -> MatchSettings:
+        return MatchSettings(
+            model,
+            self.prompt_id,
+            self.prompt_version,
+            self.information_id,
+            self.information_version,
+        )
+
     # https://stackoverflow.com/a/22096493
     @staticmethod
     def _name_parts(name: str) -> set[str]:
@@ -209,13 +357,53 @@ class Evaluator:
         self,
         model: str,
         messages: list,
-        rate_limit: AsyncLimiter,
+        rate_limit: AsyncLimiter | RateLimit,
         num_retries: int = NUM_RETRIES,
+        prompt_tokens: int | None = None,
+        **completion_args,
+    ) -> ModelResponse:
+        """
+        Get a completion, retrying on errors. With a response cache, identical requests are only sent once;
+        responses that weren't paid for have `_hidden_params["cache_hit"]` set.
+        A `RateLimit` reserves `prompt_tokens` (counted from the messages if not given) plus the expected output.
+        """
+        if self.response_cache is None:
+            return await self._request_completion(
+                model, messages, rate_limit, num_retries, prompt_tokens, **completion_args
+            )
+        return await self.response_cache.get_or_create(
+            ResponseCache.key(model, messages, completion_args),
+            lambda: self._request_completion(
+                model, messages, rate_limit, num_retries, prompt_tokens, **completion_args
+            ),
+        )
+
+    async def _request_completion(
+        self,
+        model: str,
+        messages: list,
+        rate_limit: AsyncLimiter | RateLimit,
+        num_retries: int,
+        prompt_tokens: int | None,
         **completion_args,
     ) -> ModelResponse:
+        if isinstance(rate_limit, RateLimit) and prompt_tokens == None:
+            prompt_tokens = token_counter(model=model, messages=messages)
         attempts = 0
         while True:
             try:
+                if isinstance(rate_limit, RateLimit):
+                    reservation = await rate_limit.reserve(model, prompt_tokens)  # type: ignore
+                    try:
+                        res: ModelResponse = await acompletion(
+                            model=model, messages=messages, **completion_args
+                        )  # type: ignore
+                    except BaseException:
+                        # Failed attempts (timeouts, rate limits...) don't keep their output reserved.
+                        reservation.release()
+                        raise
+                    reservation.reconcile(res)
+                    return res
                 async with rate_limit:
                     return await acompletion(
                         model=model, messages=messages, **completion_args
@@ -238,7 +426,7 @@ class Evaluator:
         character_a: Character,
         character_b: Character,
         dry_run: bool,
-        rate_limit: AsyncLimiter,
+        rate_limit: AsyncLimiter | RateLimit,
         model: str = MODEL,
         completion_args: dict = COMPLETION_ARGS,
         max_characters: int = MAX_CHARACTERS,
@@ -250,13 +438,7 @@ class Evaluator:
         debug_folder: str = DEBUG_FOLDER,
         verbose: bool = False,
     ) -> tuple[tuple[Character, Character] | None, float, MatchSettings]:
-        match_settings = MatchSettings(
-            model,
-            self.prompt_id,
-            self.prompt_version,
-            self.information_id,
-            self.information_version,
-        )
+        match_settings = self.match_settings(model)
         prompt_text = self.format(
             character_a,
             character_b,
@@ -268,12 +450,7 @@ class Evaluator:
         if debug_dump:
             with open(join(debug_folder, "last_prompt.txt"), "w") as file:
                 file.write(prompt_text)
-        messages = [
-            {
-                "role": "user",
-                "content": prompt_text,
-            },
-        ]
+        messages = self.messages(prompt_text)
         if dry_run:
             if verbose:
                 logger.info("%s vs. %s", character_a.id, character_b.id)
@@ -291,9 +468,18 @@ class Evaluator:
             winner = character_a if random.randint(0, 1) == 0 else character_b
             loser = character_a if character_b == winner else character_b
             return (winner, loser), estimated_cost, match_settings
-        res = await self.get_completion(model, messages, rate_limit, **completion_args)
+        prompt_tokens = (
+            self.prompt_tokens(
+                character_a, character_b, model, max_characters, max_tokens, max_cost
+            )
+            if isinstance(rate_limit, RateLimit)
+            else None
+        )
+        res = await self.get_completion(
+            model, messages, rate_limit, prompt_tokens=prompt_tokens, **completion_args
+        )
         res_text: str | None = res.choices[0].message.content  # type: ignore
-        cost = completion_cost(res, model)
+        cost = 0 if res._hidden_params.get("cache_hit") else completion_cost(res, model)
         if debug_dump:
             if (
                 (not debug_filter)
@@ -308,19 +494,31 @@ class Evaluator:
                     "w",
                 ) as file:
                     file.write(res_text or "")
-        winner = None
-        if res_text == None:
+        return (
+            self.winner_and_loser(res_text, character_a, character_b, verbose),
+            cost,
+            match_settings,
+        )
+
+    def winner_and_loser(
+        self,
+        response: str | None,
+        character_a: Character,
+        character_b: Character,
+        verbose: bool = False,
+    ) -> tuple[Character, Character] | None:
+        """The winner and loser of a match from the model's response, or None if it has no valid result."""
+        if response == None:
             if verbose:
                 logger.info(f"No result for %s vs. %s", character_a.id, character_b.id)
-            return (None, cost, match_settings)
-        else:
-            try:
-                winner = self.parse_result(res_text, character_a, character_b)
-                loser = character_a if character_b == winner else character_b
-                if verbose:
-                    logger.info(f"W: %s, L: %s", winner.id, loser.id)
-                return ((winner, loser), cost, match_settings)
-            except InvalidResult as e:
-                if verbose:
-                    logger.info("Invalid result: %s", str(e))
-                return (None, cost, match_settings)
+            return None
+        try:
+            winner = self.parse_result(response, character_a, character_b)
+            loser = character_a if character_b == winner else character_b
+            if verbose:
+                logger.info(f"W: %s, L: %s", winner.id, loser.id)
+            return (winner, loser)
+        except InvalidResult as e:
+            if verbose:
+                logger.info("Invalid result: %s", str(e))
+            return None
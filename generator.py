@@ -53,16 +53,30 @@ class Generator:
             "source_versions": self.source_versions,
         }
 
-    def generate_matches(
-        self, run: Run, source_manager: SourceManager, db: RunsDatabase | None
-    ) -> Iterable[PreparedMatch]:
+    def filter_characters(self, source_manager: SourceManager) -> set[CharacterId]:
         character_ids_set: set[CharacterId] = set()
-        print("Filtering Characters...")
         for potential_character_id in source_manager.all_character_ids():
             if self.character_filter.ok(potential_character_id, source_manager):
                 character_ids_set.add(potential_character_id)
+        return character_ids_set
+
+    def generate_matches(
+        self, run: Run, source_manager: SourceManager, db: RunsDatabase | None
+    ) -> Iterable[PreparedMatch]:
+        print("Filtering Characters...")
+        character_ids_set = self.filter_characters(source_manager)
         print("Filtered Characters!")
         character_ids_list: list[CharacterId] = list(character_ids_set)
+        print("Preparing Characters...")
+        characters = dict(
+            zip(
+                character_ids_list,
+                source_manager.get_characters(
+                    character_ids_list, return_exceptions=True
+                ),
+            )
+        )
+        print("Prepared Characters!")
         matches = []
         print("Generating Matches...")
         for (
@@ -74,8 +88,11 @@ class Generator:
             ),
             total=len(character_ids_set),
         ):
-            character_a = source_manager.get_character(character_a_id)
-            character_b = source_manager.get_character(character_b_id)
+            character_a = characters[character_a_id]
+            character_b = characters[character_b_id]
+            for character in (character_a, character_b):
+                if isinstance(character, Exception):
+                    raise character
             match = PreparedMatch(
                 run.run_id,
                 character_a,
@@ -0,0 +1,112 @@
+from __future__ import annotations
+from array import array
+from os.path import exists
+import os
+import pickle
+import zstandard
+
+MANIFEST_FORMAT = 1
+
+# Abridged length of characters that haven't been (or couldn't be) extracted.
+NOT_EXTRACTED = -1
+
+
+class CharacterManifest:
+    """
+    Compact metadata for every main namespace article of a source, stored column by column,
+    so filters and listings can read it without touching article bodies.
+    Only valid characters are extracted; their aliases, image and universe are known and their abridged length is set.
+    `key` identifies the store and code the manifest was built from.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.titles: list[str] = []
+        self.valid = bytearray()
+        self.lengths = array("q")
+        self.abridged_lengths = array("q")
+        self.revisions: list[str | None] = []
+        self.aliases: list[tuple[str, ...]] = []
+        self.image_names: list[str | None] = []
+        self.universes: list[str | None] = []
+        self._rows: dict[str, int] = {}
+
+    def add(self, title: str, valid: bool, length: int):
+        self._rows[title] = len(self.titles)
+        self.titles.append(title)
+        self.valid.append(valid)
+        self.lengths.append(length)
+        self.abridged_lengths.append(NOT_EXTRACTED)
+        self.revisions.append(None)
+        self.aliases.append(())
+        self.image_names.append(None)
+        self.universes.append(None)
+
+    def set_extracted(
+        self,
+        title: str,
+        revision: str,
+        abridged_length: int,
+        aliases: list[str],
+        image_name: str | None,
+        universe: str | None,
+    ):
+        row = self._rows[title]
+        self.revisions[row] = revision
+        self.abridged_lengths[row] = abridged_length
+        self.aliases[row] = tuple(aliases)
+        self.image_names[row] = image_name
+        self.universes[row] = universe
+
+    def row(self, title: str) -> int | None:
+        return self._rows.get(title)
+
+    def extracted_row(self, title: str) -> int | None:
+        """The row of a character that was extracted, if any."""
+        row = self._rows.get(title)
+        if row is None or self.abridged_lengths[row] == NOT_EXTRACTED:
+            return None
+        return row
+
+    def valid_titles(self) -> list[str]:
+        return [title for title, valid in zip(self.titles, self.valid) if valid]
+
+    def save(self, path: str):
+        columns = {
+            "format": MANIFEST_FORMAT,
+            "key": self.key,
+            "titles": self.titles,
+            "valid": self.valid,
+            "lengths": self.lengths,
+            "abridged_lengths": self.abridged_lengths,
+            "revisions": self.revisions,
+            "aliases": self.aliases,
+            "image_names": self.image_names,
+            "universes": self.universes,
+        }
+        with open(path + ".tmp", "wb") as manifest_file:
+            manifest_file.write(zstandard.ZstdCompressor().compress(pickle.dumps(columns)))
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path: str, key: str) -> CharacterManifest | None:
+        """Load a manifest, if it exists and was built with the same key."""
+        if not exists(path):
+            return None
+        with open(path, "rb") as manifest_file:
+            columns = pickle.loads(
+                zstandard.ZstdDecompressor().decompress(manifest_file.read())
+            )
+        if columns["format"] != MANIFEST_FORMAT or columns["key"] != key:
+            return None
+        manifest = CharacterManifest(key)
+        manifest.titles = columns["titles"]
+        manifest.valid = columns["valid"]
+        manifest.lengths = columns["lengths"]
+        manifest.abridged_lengths = columns["abridged_lengths"]
+        manifest.revisions = columns["revisions"]
+        manifest.aliases = columns["aliases"]
+        manifest.image_names = columns["image_names"]
+        manifest.universes = columns["universes"]
+        manifest._rows = dict((title, row) for row, title in enumerate(manifest.titles))
+        return manifest
@@ -3,11 +3,10 @@ from mediawiki import (
     MediaWiki,
     WikiArticle,
     wikitext_transformer,
-    replace_templates,
     Template,
 )
 from wikitextparser import WikiText, parse, Section
-from exceptions import NotACharacterException, ParseException
+from exceptions import NotACharacterException
 import logging
 from typing import Iterable
 from character import Character
@@ -17,6 +16,20 @@ logger = logging.getLogger(__name__)
 
 CHARACTER_PATTERN = re.compile("{{\\s*Marvel Database:\\s*Character Template")
 
+LINK_TEMPLATES = [
+    "cid",
+    "cis",
+    "cl",
+    "el",
+    "elt",
+    "eltd",
+    "ml",
+    "Power Link",
+    "sl",
+    "sld",
+    "vl",
+]
+
 
 class MarvelWiki(MediaWiki):
     SOURCE_ID = "marvel"
@@ -26,8 +39,14 @@ class MarvelWiki(MediaWiki):
     DUMP_URL = "https://s3.amazonaws.com/wikia_xml_dumps/e/en/enmarveldatabase_pages_current.xml.7z"
     DUMP_FORMAT = "7z"
 
+    # Bump when this source's transformers change.
+    TRANSFORMER_VERSION = 1
+
     WIKI_URL = "https://marvel.fandom.com/wiki"
 
+    # Uncomment to only keep Earth-616 characters when parsing the dump.
+    # TITLE_FILTER = re.compile(".* \\(Earth-616\\)")
+
     IGNORE_CHARACTER_NAMES = [
         "Adolf Hitler (Earth-616)"
     ]  # Might be over cautious, but I don't want to get banned.
@@ -75,42 +94,15 @@ class MarvelWiki(MediaWiki):
             return []
         return [parse(current_alias.value).plain_text().strip()]
 
-    @wikitext_transformer
-    def expand_membership(self, title: str, wikitext: WikiText):
+    @wikitext_transformer(templates=["m"])
+    def expand_membership(self, title: str, template: Template):
         """
         The membership template automatically includes a character in a universe-specific group.
         See https://marvel.fandom.com/wiki/Module:Members.
         """
-
-        template = next(
-            (
-                template
-                for template in wikitext.templates
-                if template.normal_name().replace("Marvel Database:", "").strip()
-                in [
-                    "Character Template",
-                    "Team Template",
-                    "Organization Template",
-                    "Race Template",
-                    "Item Template",
-                    "Vehicle Template",
-                    "Location Template",
-                ]
-            ),
-            None,
-        )
-        if not template:
-            raise ParseException("No template included; cannot determine reality.")
-        # TODO: Handle "Moira" edge cases (see https://marvel.fandom.com/wiki/Module:Reality)
-        reality = template.get_arg("Reality")
-        if reality:
-            reality = reality.plain_text()
-
-        def member_to_text(template: Template):
-            if template.normal_name() == "m":
-                return template.arguments[0].plain_text()
-
-        replace_templates(wikitext, member_to_text)
+        # TODO: Use the reality from the character template, and handle "Moira" edge cases (see https://marvel.fandom.com/wiki/Module:Reality)
+        if template.normal_name() == "m":
+            return template.arguments[0].plain_text()
 
     @wikitext_transformer
     def expand_character_template(self, title: str, wikitext: WikiText):
@@ -163,31 +155,25 @@ class MarvelWiki(MediaWiki):
 
         wikitext.string = "\n".join(new_sections)
 
-    @wikitext_transformer
-    def expand_links(self, title: str, wikitext: WikiText):
-        def link_replacer(template: Template):
-            if template.normal_name() in [
-                "cid",
-                "cis",
-                "cl",
-                "el",
-                "elt",
-                "eltd",
-                "ml",
-                "Power Link",
-                "sl",
-                "sld",
-                "vl",
-            ]:
-                return template.arguments[-1].value
-
-        replace_templates(wikitext, link_replacer)
+    @wikitext_transformer(templates=LINK_TEMPLATES)
+    def expand_links(self, title: str, template: Template):
+        if template.normal_name() in LINK_TEMPLATES:
+            return template.arguments[-1].value
 
     def is_valid_character(self, name: str, article: WikiArticle):
         return super().is_valid_character(name, article) and any(
             re.finditer(CHARACTER_PATTERN, article.content)
         )
 
+    def extract_universe(self, title: str, wikitext: WikiText) -> str | None:
+        character_template = self._get_character_template(wikitext)
+        reality = character_template.get_arg("Reality") if character_template else None
+        if reality and reality.value.strip():
+            return parse(reality.value).plain_text().strip()
+        # Character titles end with their reality, e.g. "Peter Parker (Earth-616)".
+        match = re.search(r"\(([^()]+)\)$", title)
+        return match.group(1) if match else None
+
     def extract_image_name(self, title: str, wikitext: WikiText):
         character_box = self._get_character_template(wikitext)
         if not character_box:
@@ -11,6 +11,7 @@ if TYPE_CHECKING:
     from db import RunsDatabase, RunID, MatchID
     from source_manager import SourceManager
     from evaluate import Evaluator
+    from rate_limit import RateLimit
 
 
 class Outcome(Enum):
@@ -63,7 +64,7 @@ class PreparedMatch:
         self,
         evaluator: Evaluator,
         dry_run: bool,
-        rate_limit: AsyncLimiter,
+        rate_limit: AsyncLimiter | RateLimit,
         **evaluation_args,
     ) -> MatchResult:
         """
@@ -78,6 +79,15 @@ class PreparedMatch:
             rate_limit,
             **evaluation_args,
         )
+        return self.record(w_l, cost, match_settings)
+
+    def record(
+        self,
+        w_l: tuple[Character, Character] | None,
+        cost: float,
+        match_settings: MatchSettings,
+    ) -> MatchResult:
+        """Record the result of the match (the winner and loser, or None if it failed), updating the database if there is one."""
         outcome = Outcome.ERROR
         if w_l:
             winner = w_l[0]
@@ -1,55 +1,68 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Iterable, Callable, TypeAlias, Union, IO
+from typing import Any, Iterable, Iterator, Callable, TypeAlias, Union, IO
 from lxml.etree import iterparse, ElementBase
+from concurrent.futures import ProcessPoolExecutor, Future
+from collections import deque
+from io import BytesIO
 from source import Source
-from urllib.parse import quote_plus, quote, urlencode
+from article_store import ArticleStore, ArticleStoreWriter, WikiArticle, STORE_FORMAT
+from urllib.parse import quote, urlencode
 import os
 from os.path import join, exists
 import pickle
-from character import CharacterId, Section, Character
+import json
+from character import (
+    CharacterId,
+    CompactSections,
+    Section,
+    Character,
+    abridgement_order,
+)
 import wikitextparser as wtp
 from wikitextparser import Template, WikiText, WikiLink
 import re
 import zstandard
-import requests
 from py7zr import SevenZipFile
 from config import *
 from exceptions import NotACharacterException
 from dateutil.parser import parse as parsedate
-from utils import copying_cache
+from utils import BoundedPipe
+from threading import Thread
+from functools import partial
+from disk_cache import DiskCache, content_key
+from manifest import CharacterManifest
+from plain_text import fast_plain_text
+import asyncio
 
 NAMESPACE = "http://www.mediawiki.org/xml/export-0.11/"
 
 
-class WikiArticle:
-    title: str
-    revision: datetime
-    content: str
-    namespace: int
-
-    def __init__(self, el: ElementBase, namespace=NAMESPACE):
-        ns = {"mw": namespace}
-        self.title = el.findtext(f"mw:title", namespaces=ns)  # type: ignore
-        text = el.findtext(f"mw:revision/mw:text", namespaces=ns)
-        self.revision = parsedate(el.findtext(f"mw:revision/mw:timestamp", namespaces=ns))  # type: ignore
-        self.namespace = int(el.findtext(f"mw:ns", namespaces=ns))  # type: ignore
-        if text:
-            self.content = text
-        else:
-            self.content = ""
-
-    def __str__(self):
-        return f'(Article "{self.title}")'
-
-    def __repr__(self):
-        return f'(Article "{self.title}")'
+def article_from_element(el: ElementBase, namespace=NAMESPACE) -> WikiArticle:
+    ns = {"mw": namespace}
+    return WikiArticle(
+        el.findtext(f"mw:title", namespaces=ns),  # type: ignore
+        parsedate(el.findtext(f"mw:revision/mw:timestamp", namespaces=ns)),  # type: ignore
+        el.findtext(f"mw:revision/mw:text", namespaces=ns) or "",
+        int(el.findtext(f"mw:ns", namespaces=ns)),  # type: ignore
+    )
 
 
 class MediaWikiCharacter(Character):
-    def __init__(self, *args, image_url: str | None = None, **kwargs):
+    __slots__ = ("_image_url", "image_name", "universe")
+
+    def __init__(
+        self,
+        *args,
+        image_url: str | None = None,
+        image_name: str | None = None,
+        universe: str | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self._image_url = image_url
+        self.image_name = image_name
+        self.universe = universe
 
     def get_image_url(
         self, max_width: int | None = None, max_height: int | None = None
@@ -64,6 +77,180 @@ class MediaWikiCharacter(Character):
         return self._image_url + "?" + urlencode(parameters)
 
 
+def iter_dump_articles(
+    stream: IO,
+    namespaces: Iterable[int],
+    title_filter: re.Pattern | None = None,
+) -> Iterator[WikiArticle]:
+    """
+    Stream the articles in an XML dump, in dump order.
+    Pages outside of `namespaces`, and main namespace pages whose title doesn't match `title_filter`,
+    are skipped before an article is built. Each page element is freed once it's handled,
+    so memory use doesn't grow with the size of the dump.
+    """
+    namespaces = set(str(namespace) for namespace in namespaces)
+    for _, elem in iterparse(stream, events=("end",), tag=f"{{{NAMESPACE}}}page"):
+        namespace = elem.findtext(f"{{{NAMESPACE}}}ns")
+        if namespace in namespaces and (
+            title_filter is None
+            or namespace != "0"
+            or title_filter.fullmatch(elem.findtext(f"{{{NAMESPACE}}}title") or "")
+        ):
+            yield article_from_element(elem)
+        # Free the page and any siblings already handled.
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def split_dump(stream: IO[bytes], chunk_size: int = PARSE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Split an XML dump into page-aligned chunks of roughly `chunk_size` bytes.
+    Each chunk is wrapped in the dump's header (everything before the first page) and footer,
+    so it's a complete document that can be parsed independently.
+    """
+    # A bytearray grows in place, so the short reads of a pipe don't copy the buffer every time.
+    buffer = bytearray()
+    while b"<page>" not in buffer:
+        block = stream.read(chunk_size)
+        if not block:
+            return
+        buffer += block
+    header_end = buffer.index(b"<page>")
+    header = bytes(buffer[:header_end])
+    footer = b"</mediawiki>"
+    del buffer[:header_end]
+    while True:
+        block = stream.read(chunk_size)
+        if block:
+            buffer += block
+        if not block or len(buffer) >= chunk_size:
+            cut = buffer.rfind(b"</page>")
+            if cut != -1:
+                cut += len(b"</page>")
+                yield b"".join((header, buffer[:cut], footer))
+                del buffer[:cut]
+        if not block:
+            break
+
+
+def parse_dump_chunk(
+    chunk: bytes, namespaces: Iterable[int], title_filter: re.Pattern | None = None
+) -> list[WikiArticle]:
+    return list(iter_dump_articles(BytesIO(chunk), namespaces, title_filter))
+
+
+class _ArchiveTarget:
+    """Adapts a pipe to the path-like interface py7zr extracts files into."""
+
+    def __init__(self, pipe: BoundedPipe):
+        self.pipe = pipe
+
+    @property
+    def parent(self):
+        return self
+
+    def mkdir(self, parents=None, exist_ok=False):
+        pass
+
+    def open(self, mode=None):
+        return self
+
+    def write(self, data: bytes) -> int:
+        return self.pipe.write(data)
+
+    def seek(self, position: int):
+        pass
+
+    def flush(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def extract_7z(path: str, pipe: BoundedPipe):
+    """Decompress the first file in a 7z archive into `pipe`, without holding it in memory."""
+    try:
+        with SevenZipFile(path) as archive:
+            target = next(f for f in archive.files if not f.is_directory)
+            for f in archive.files:
+                archive.worker.register_filelike(
+                    f.id, _ArchiveTarget(pipe) if f.id == target.id else None
+                )
+            archive.worker.extract(archive.fp, None, parallel=False)
+    except BrokenPipeError:
+        if pipe.aborted:
+            # The reader stopped reading.
+            return
+        raise
+    except BaseException as e:
+        pipe.close(e)
+        raise
+    pipe.close()
+
+
+class RefreshManifest:
+    """The titles added, changed and removed when a source was refreshed from a newer dump."""
+
+    def __init__(
+        self,
+        source_id: str,
+        from_version: str | None,
+        to_version: str | None = None,
+        added: list[str] | None = None,
+        changed: list[str] | None = None,
+        removed: list[str] | None = None,
+    ):
+        self.source_id = source_id
+        self.from_version = from_version
+        self.to_version = to_version
+        self.added = added or []
+        self.changed = changed or []
+        self.removed = removed or []
+
+    @property
+    def changed_titles(self) -> set[str]:
+        """Every title whose content differs between the two versions."""
+        return set(self.added) | set(self.changed) | set(self.removed)
+
+    def to_object(self):
+        return {
+            "source_id": self.source_id,
+            "from_version": self.from_version,
+            "to_version": self.to_version,
+            "added": self.added,
+            "changed": self.changed,
+            "removed": self.removed,
+        }
+
+    @staticmethod
+    def from_object(object: dict[str, Any]) -> RefreshManifest:
+        return RefreshManifest(
+            object["source_id"],
+            object["from_version"],
+            object["to_version"],
+            object["added"],
+            object["changed"],
+            object["removed"],
+        )
+
+    def save(self, folder: str) -> str:
+        os.makedirs(folder, exist_ok=True)
+        path = join(folder, f"{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+        with open(path, "w") as file:
+            json.dump(self.to_object(), file)
+        return path
+
+    @staticmethod
+    def load(path: str) -> RefreshManifest:
+        with open(path, "r") as file:
+            return RefreshManifest.from_object(json.load(file))
+
+
 DeepPagesList: TypeAlias = list[Union[WikiArticle, "DeepPagesList"]]
 
 
@@ -85,15 +272,38 @@ def combine_subpages(depth, pages: DeepPagesList) -> str:
     return content
 
 
+def section_plain_text(wikitext: str, converter: str) -> str:
+    """Convert a section to plain text, without blank lines."""
+    text = fast_plain_text(wikitext) if converter == "fast" else None
+    if text is None:
+        text = wtp.parse(wikitext).plain_text()
+    return re.sub("[\n]+", "\n", text)
+
+
 # Used to determine transformer order.
 _transformer_count = 0
 
 
-def wikitext_transformer(method=None, removes_information=True):
+def wikitext_transformer(
+    method=None,
+    removes_information=True,
+    templates: Iterable[str] | None = None,
+    wikilinks: Iterable[str] | None = None,
+):
+    """
+    Register a method that transforms a character's wikitext. Transformers run in the order they're defined.
+    By default, the method is called with the whole wikitext and modifies it in place.
+    With `templates` (template names) or `wikilinks` (link title prefixes), it's called with each matching
+    template or wikilink instead, and returns its replacement or None to leave it unchanged.
+    Consecutive template and wikilink transformers share a single traversal of the wikitext.
+    """
+
     def inner_decorator(method):
         global _transformer_count
         method._wikitext_transformer = _transformer_count
         method._removes_information = removes_information
+        method._templates = templates
+        method._wikilinks = wikilinks
         _transformer_count += 1
         return method
 
@@ -103,36 +313,162 @@ def wikitext_transformer(method=None, removes_information=True):
         return inner_decorator
 
 
-def replace_templates(wikitext: WikiText, replacer: Callable[[Template], str | None]):
-    index = 0
-    while True:
-        templates = wikitext.templates
-        if index >= len(templates):
-            break
-        template = templates[index]
-        replacement = replacer(template)
-        if replacement == None:
-            index += 1
+def _capitalize(name: str) -> str:
+    return name[:1].upper() + name[1:]
+
+
+class NodeRewriter:
+    """
+    Replaces the templates with the given names and the wikilinks whose titles start with the given prefixes
+    (or every template or wikilink with True). `replacer` returns the replacement, or None to leave the node unchanged.
+    """
+
+    def __init__(
+        self,
+        replacer: Callable[[Any], str | None],
+        templates: Iterable[str] | bool | None = None,
+        wikilinks: Iterable[str] | bool | None = None,
+    ):
+        self.replacer = replacer
+        self.templates = (
+            templates
+            if isinstance(templates, bool) or templates is None
+            else frozenset(_capitalize(name) for name in templates)
+        )
+        self.wikilinks = (
+            wikilinks
+            if isinstance(wikilinks, bool) or wikilinks is None
+            else tuple(wikilinks)
+        )
+
+    def matches(self, node: _Node) -> bool:
+        if node.is_template:
+            return self.templates is True or (
+                bool(self.templates) and node.name in self.templates  # type: ignore
+            )
+        else:
+            return self.wikilinks is True or (
+                bool(self.wikilinks) and node.name.startswith(self.wikilinks)  # type: ignore
+            )
+
+
+class _Node:
+    """A template or wikilink, with the templates and wikilinks nested inside it."""
+
+    def __init__(self, item: Template | WikiLink, start: int, end: int):
+        self.item = item
+        self.start = start
+        self.end = end
+        self.children: list[_Node] = []
+        self.is_template = isinstance(item, Template)
+        self._name = None
+
+    @property
+    def name(self) -> str:
+        if self._name is None:
+            if isinstance(self.item, Template):
+                self._name = self.item.normal_name(capitalize=True)
+            else:
+                self._name = self.item.title
+        return self._name
+
+
+def _node_tree(wikitext: WikiText) -> list[_Node]:
+    """The outermost templates and wikilinks of the wikitext, in order, with positions relative to its string."""
+    offset = wikitext.span[0]
+    items = sorted(
+        [*wikitext.templates, *wikitext.wikilinks],
+        key=lambda item: (item.span[0], -item.span[1]),
+    )
+    roots: list[_Node] = []
+    stack: list[_Node] = []
+    for item in items:
+        node = _Node(item, item.span[0] - offset, item.span[1] - offset)
+        while stack and stack[-1].end < node.end:
+            stack.pop()
+        (stack[-1].children if stack else roots).append(node)
+        stack.append(node)
+    return roots
+
+
+def _rewrite_nodes(
+    string: str, nodes: list[_Node], start: int, end: int, rewriters: list[NodeRewriter]
+) -> str:
+    pieces = []
+    position = start
+    for node in nodes:
+        if node.start < position:
             continue
-        span = template.span
-        old_string = wikitext.string
-        wikitext.string = old_string[: span[0]] + replacement + old_string[span[1] :]
+        pieces.append(string[position : node.start])
+        pieces.append(_rewrite_node(string, node, rewriters))
+        position = node.end
+    pieces.append(string[position:end])
+    return "".join(pieces)
 
 
-def replace_wikilinks(wikitext: WikiText, replacer: Callable[[WikiLink], str | None]):
-    index = 0
-    while True:
-        wikilinks = wikitext.wikilinks
-        if index >= len(wikilinks):
-            break
-        wikilink = wikilinks[index]
-        replacement = replacer(wikilink)
-        if replacement == None:
-            index += 1
+def _rewrite_node(string: str, node: _Node, rewriters: list[NodeRewriter]) -> str:
+    """
+    Apply each rewriter's pass to a node, with the same result as applying them one after another.
+    A rewriter's pass over the node's children is only applied once a later rewriter needs to see it,
+    or once none of them replaced the node.
+    """
+    text = string[node.start : node.end]
+    # Rewriters from this index on haven't been applied to the node's children yet.
+    pending = 0
+    for i, rewriter in enumerate(rewriters):
+        if not rewriter.matches(node):
             continue
-        span = wikilink.span
-        old_string = wikitext.string
-        wikitext.string = old_string[: span[0]] + replacement + old_string[span[1] :]
+        if i > pending and node.children:
+            rewritten = _rewrite_nodes(
+                string, node.children, node.start, node.end, rewriters[pending:i]
+            )
+            if rewritten != text:
+                text = rewritten
+                string = rewritten
+                roots = _node_tree(wtp.parse(text))
+                if len(roots) != 1 or roots[0].end != len(text):
+                    # The rewritten children changed what the node is.
+                    return _rewrite_text(text, rewriters[i:])
+                node = roots[0]
+        pending = i
+        replacement = rewriter.replacer(node.item)
+        if replacement is not None:
+            # Like rescanning after the replacement, the replacement is rewritten by this and the following rewriters.
+            return _rewrite_text(replacement, rewriters[i:])
+    if not node.children:
+        return text
+    return _rewrite_nodes(string, node.children, node.start, node.end, rewriters[pending:])
+
+
+def _rewrite_text(text: str, rewriters: list[NodeRewriter]) -> str:
+    if not rewriters or ("{{" not in text and "[[" not in text):
+        return text
+    return _rewrite_nodes(
+        text, _node_tree(wtp.parse(text)), 0, len(text), rewriters
+    )
+
+
+def rewrite_wikitext(wikitext: WikiText, rewriters: list[NodeRewriter]) -> str | None:
+    """
+    Apply rewriters to the templates and wikilinks of the wikitext, in order, with the same result as
+    applying each in its own pass and re-parsing in between. Every node is visited in a single traversal
+    of one parse, and the replacements are spliced in at once. Returns None if nothing changed.
+    """
+    string = wikitext.string
+    rewritten = _rewrite_nodes(string, _node_tree(wikitext), 0, len(string), rewriters)
+    return None if rewritten == string else rewritten
+
+
+def replace_templates(wikitext: WikiText, replacer: Callable[[Template], str | None]):
+    string = rewrite_wikitext(wikitext, [NodeRewriter(replacer, templates=True)])
+    if string is not None:
+        wikitext.string = string
+
+
+def replace_wikilinks(wikitext: WikiText, replacer: Callable[[WikiLink], str | None]):
+    string = rewrite_wikitext(wikitext, [NodeRewriter(replacer, wikilinks=True)])
+    if string is not None:
+        wikitext.string = string
 
 
 class MediaWiki(Source):
@@ -149,132 +485,355 @@ class MediaWiki(Source):
     SECTION_PRIORITY: dict[str, float] = {}
     DEFAULT_SECTION_PRIORITY = 2
 
+    # "fast" or "wikitextparser" (see config).
+    PLAIN_TEXT_CONVERTER: str = PLAIN_TEXT_CONVERTER
+
+    # Bump when the way articles are turned into characters changes (including plain text conversion), to invalidate processed characters.
+    # Each source class has its own version, so sources bump theirs without affecting the others.
+    # Section priorities and ignored names are part of the fingerprint already, so editing them doesn't need a bump.
+    TRANSFORMER_VERSION = 2
+
     IGNORE_CHARACTER_NAMES = []
 
+    # Namespaces kept from the dump: articles, files, templates and categories.
+    NAMESPACES: list[int] = [0, 6, 10, 14]
+    # If set, only main namespace articles whose full title matches are kept from the dump.
+    TITLE_FILTER: re.Pattern | None = None
+
+    articles: ArticleStore
+    manifest: CharacterManifest | None = None
+
     def __init__(self, download_path: str = DOWNLOADS_FOLDER):
-        self.cache_path = join(download_path, self.SOURCE_ID, "wiki.pickle.zst")
+        super().__init__(download_path)
+        self.legacy_cache_path = join(download_path, self.SOURCE_ID, "wiki.pickle.zst")
         self.dump_path = join(download_path, self.SOURCE_ID, "wiki.xml.7z")
         self.image_path = join(download_path, self.SOURCE_ID, "images")
+        self.manifest_path = join(download_path, self.SOURCE_ID, "manifest.pickle.zst")
+        self.character_cache = (
+            DiskCache(
+                join(download_path, self.SOURCE_ID, "characters.sqlite"),
+                PROCESSED_CHARACTER_CACHE_MAX_BYTES,
+                PROCESSED_CHARACTER_CACHE_MAX_AGE,
+            )
+            if CACHE_PROCESSED_CHARACTERS
+            else None
+        )
+        self._transformer_fingerprint: str | None = None
+        self._dependencies: dict[str, str | None] | None = None
+        # Expansions built in this process, by key.
+        self._expansions: dict[str, dict[str, Any]] = {}
         # Register template renderers
         self.wikitext_transformers = []
-        for name in dir(self):
-            method = getattr(self, name)
-            if hasattr(method, "_wikitext_transformer"):
-                self.wikitext_transformers.append(method)
+        for name in dir(type(self)):
+            # Look up on the class to avoid evaluating properties.
+            if hasattr(getattr(type(self), name), "_wikitext_transformer"):
+                self.wikitext_transformers.append(getattr(self, name))
         self.wikitext_transformers.sort(key=lambda method: method._wikitext_transformer)
-        super().__init__(download_path)
 
     @property
     def downloaded(self):
-        return exists(self.cache_path)
-
-    def parse_from_stream(self, stream: IO):
-        self.articles = {}
-        for action, elem in iterparse(stream):
-            if action == "end":
-                if elem.tag == f"{{{NAMESPACE}}}page":
-                    if elem.findtext(f"{{{NAMESPACE}}}ns") in ["0", "6", "10", "14"]:
-                        article = WikiArticle(elem)
-                        self.articles[article.title] = article
+        return ArticleStore.exists(self.path) or exists(self.legacy_cache_path)
+
+    def read_dump(
+        self,
+        stream: IO,
+        processes: int | None = PARSE_PROCESSES,
+        title_filter: re.Pattern | None = None,
+    ) -> Iterator[WikiArticle]:
+        """
+        Stream the articles in an XML dump.
+        With more than one process, the dump is split into page-aligned chunks which are parsed in a process pool.
+        Chunks are merged in dump order, so the result is identical to parsing serially.
+        `title_filter` overrides `TITLE_FILTER`.
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        title_filter = title_filter or self.TITLE_FILTER
+        if processes <= 1:
+            yield from iter_dump_articles(stream, self.NAMESPACES, title_filter)
+        else:
+            with ProcessPoolExecutor(processes) as executor:
+                # Bound the number of chunks in flight so the dump is never fully in memory.
+                pending: deque[Future[list[WikiArticle]]] = deque()
+                for chunk in split_dump(stream):
+                    pending.append(
+                        executor.submit(
+                            parse_dump_chunk, chunk, self.NAMESPACES, title_filter
+                        )
+                    )
+                    if len(pending) >= processes * 2:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+
+    def parse_from_stream(
+        self,
+        stream: IO,
+        processes: int | None = PARSE_PROCESSES,
+        title_filter: re.Pattern | None = None,
+    ):
+        """Parse an XML dump into the article store, streaming articles straight to disk."""
+        self.write_store(self.read_dump(stream, processes, title_filter))
+
+    def write_store(self, articles: Iterable[WikiArticle]):
+        """Write articles to the article store, replacing any existing store, and open it."""
+        with ArticleStoreWriter(self.path) as writer:
+            for article in articles:
+                writer.add(article)
+            # Set last, as the version may be discovered while the dump is streamed.
+            writer.set_meta("version", self.version)
+        self.articles = ArticleStore(self.path)
+        self.clear_character_names()
+        self.manifest = None
         self.parsed = True
 
-    def cache(self):
-        print("Caching...")
-        with open(self.cache_path, "wb") as cache:
-            cctx = zstandard.ZstdCompressor()
-            with cctx.stream_writer(cache) as writer:
-                pickle.dump(self.articles, writer)
-        print("Cached!")
+    def update_store(self, articles: Iterable[WikiArticle]) -> RefreshManifest:
+        """
+        Update the article store from a newer dump, only rewriting articles whose revision changed.
+        Articles that are no longer in the dump are removed.
+        """
+        manifest = RefreshManifest(self.SOURCE_ID, self.articles.get_meta("version"))
+        with ArticleStoreWriter(self.path, update=True) as writer:
+            writer.con.execute("CREATE TEMP TABLE seen (title TEXT PRIMARY KEY)")
+            for article in articles:
+                writer.con.execute(
+                    "INSERT OR IGNORE INTO seen VALUES (?)", (article.title,)
+                )
+                revision = writer.revision(article.title)
+                if revision is None:
+                    manifest.added.append(article.title)
+                elif revision != article.revision.isoformat():
+                    manifest.changed.append(article.title)
+                else:
+                    continue
+                writer.add(article)
+            manifest.removed = [
+                title
+                for (title,) in writer.con.execute(
+                    "SELECT title FROM articles WHERE title NOT IN (SELECT title FROM seen)"
+                ).fetchall()
+            ]
+            for title in manifest.removed:
+                writer.remove(title)
+            writer.set_meta("version", self.version)
+        manifest.to_version = self.version
+        self.articles = ArticleStore(self.path)
+        self.clear_character_names()
+        self.manifest = None
+        self.parsed = True
+        return manifest
+
+    def open_dump(self, dump_path: str) -> IO:
+        """Open a downloaded dump as a stream of XML, decompressing it in another thread if necessary."""
+        if self.DUMP_FORMAT == "xml":
+            return open(dump_path, "rb")
+        elif self.DUMP_FORMAT == "7z":
+            pipe = BoundedPipe()
+            Thread(target=extract_7z, args=(dump_path, pipe), daemon=True).start()
+            return pipe
+        else:
+            raise NotImplementedError(self.DUMP_FORMAT)
 
     def parse(self):
         if self.parsed:
             # Already parsed.
             return
-        if exists(self.cache_path):
-            with open(self.cache_path, "rb") as cache:
+        if ArticleStore.exists(self.path):
+            self.articles = ArticleStore(self.path)
+            if self.articles.get_meta("format") != str(STORE_FORMAT):
+                print("Upgrading article store...")
+                with ArticleStoreWriter(self.path, update=True):
+                    pass
+                self.articles = ArticleStore(self.path)
+            self.version = self.articles.get_meta("version")
+            self.parsed = True
+        elif exists(self.legacy_cache_path):
+            # Migrate the old monolithic cache to the article store.
+            print("Migrating cache...")
+            with open(self.legacy_cache_path, "rb") as cache:
                 dctx = zstandard.ZstdDecompressor()
                 with dctx.stream_reader(cache) as reader:
-                    self.articles: dict[str, WikiArticle] = pickle.load(reader)
+                    articles: dict[str, WikiArticle] = pickle.load(reader)
+            self.write_store(articles.values())
+            print("Migrated!")
         elif exists(self.dump_path):
-            if self.DUMP_FORMAT == "xml":
-                with open(self.dump_path, "rb") as dump:
-                    return self.parse_from_stream(dump)
-            elif self.DUMP_FORMAT == "7z":
-                with SevenZipFile(self.dump_path) as compressed_dump:
-                    with next(iter(compressed_dump.readall().values())) as extracted:  # type: ignore
-                        return self.parse_from_stream(extracted)
-            else:
-                raise NotImplementedError(self.DUMP_FORMAT)
-            self.cache()
+            with self.open_dump(self.dump_path) as dump:
+                self.parse_from_stream(dump)
         else:
             raise Exception("Not downloaded!")
 
-    async def download(self):
-        os.makedirs(self.path, exist_ok=True)
-        print("Downloading", self.DUMP_URL)
-        tmp_download_path = None
-        self.version = str(datetime.now())
-        if not exists(self.dump_path):
-            with open(self.dump_path, "wb") as local_dump:
+    async def fetch_dump(self, dump_path: str, pipe: BoundedPipe | None = None):
+        """
+        Download the dump to `dump_path`, also writing it to `pipe` if provided.
+        `version` is set to the dump's last modified date, if known.
+        """
+        try:
+            with open(dump_path + ".part", "wb") as local_dump:
                 async with ASYNC_CLIENT.stream("GET", self.DUMP_URL) as remote_dump:
-                    async for chunk in remote_dump.aiter_bytes():
-                        local_dump.write(chunk)
+                    remote_dump.raise_for_status()
                     if "last-modified" in remote_dump.headers:
                         self.version = str(
                             parsedate(remote_dump.headers["last-modified"])
                         )
+                    async for chunk in remote_dump.aiter_bytes():
+                        local_dump.write(chunk)
+                        if pipe:
+                            await asyncio.to_thread(pipe.write, chunk)
+        except BaseException as e:
+            if pipe:
+                pipe.close(e)
+            raise
+        if pipe:
+            pipe.close()
+        os.replace(dump_path + ".part", dump_path)
+
+    async def download(self):
+        """
+        Download and parse the dump.
+        XML dumps are parsed while they download. 7z archives can't be read until they're fully downloaded
+        (their header is at the end), but are then decompressed and parsed concurrently.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        print("Downloading", self.DUMP_URL)
+        self.version = str(datetime.now())
+        if not exists(self.dump_path):
+            if self.DUMP_FORMAT == "xml":
+                pipe = BoundedPipe()
+
+                def parse():
+                    # Aborts the pipe if parsing fails, so the download stops writing to it.
+                    with pipe:
+                        self.parse_from_stream(pipe)
+
+                parsing = asyncio.create_task(asyncio.to_thread(parse))
+                fetching = asyncio.create_task(self.fetch_dump(self.dump_path, pipe))
+                try:
+                    await asyncio.wait(
+                        [parsing, fetching], return_when=asyncio.FIRST_EXCEPTION
+                    )
+                finally:
+                    # If parsing failed, nothing reads the pipe, so the download is cancelled.
+                    fetching.cancel()
+                    await asyncio.gather(parsing, fetching, return_exceptions=True)
+                await parsing
+                await fetching
+            else:
+                await self.fetch_dump(self.dump_path)
             print("Downloaded!")
         else:
             print("Already downloaded!")
-        print("Parsing...")
-        self.parse()
-        print("Parsed!")
-        self.cache()
-        if tmp_download_path:
-            if not KEEP_ORIGINAL_DOWNLOADS:
-                print("Deleting original...")
-                os.remove(tmp_download_path)
-                print("Deleted!")
+        if not self.parsed:
+            print("Parsing...")
+            await asyncio.to_thread(self.parse)
+            print("Parsed!")
         os.makedirs(self.image_path, exist_ok=True)
 
+    async def refresh(self) -> RefreshManifest:
+        """
+        Download the latest dump and incrementally update the article store, only rewriting changed pages.
+        Returns a manifest of the changed titles, which is also saved in the source's refreshes folder.
+        """
+        self.parse()
+        head = await ASYNC_CLIENT.head(self.DUMP_URL)
+        if (
+            "last-modified" in head.headers
+            and str(parsedate(head.headers["last-modified"])) == self.version
+        ):
+            print("Already up to date!")
+            return RefreshManifest(self.SOURCE_ID, self.version, self.version)
+        new_dump_path = self.dump_path + ".new"
+        print("Downloading", self.DUMP_URL)
+        self.version = str(datetime.now())
+        await self.fetch_dump(new_dump_path)
+        print("Downloaded!")
+        print("Updating...")
+
+        def update():
+            with self.open_dump(new_dump_path) as dump:
+                return self.update_store(self.read_dump(dump))
+
+        had_manifest = self.manifest is not None or exists(self.manifest_path)
+        manifest = await asyncio.to_thread(update)
+        os.replace(new_dump_path, self.dump_path)
+        if had_manifest or BUILD_MANIFEST:
+            # Keep a manifest that was built on request up to date.
+            await asyncio.to_thread(self.update_manifest)
+        manifest.save(join(self.path, "refreshes"))
+        print(
+            f"Updated! {len(manifest.added)} added, {len(manifest.changed)} changed, {len(manifest.removed)} removed."
+        )
+        return manifest
+
     def all_articles(self) -> Iterable[WikiArticle]:
         return iter(self.articles.values())
 
     def get_article(self, title) -> WikiArticle | None:
-        return self.articles.get(title)
+        article = self.articles.get(title)
+        if self._dependencies is not None:
+            self._dependencies[title] = article.revision.isoformat() if article else None
+        return article
+
+    def has_article(self, title) -> bool:
+        revision = self.articles.revision(title)
+        if self._dependencies is not None:
+            self._dependencies[title] = revision
+        return revision is not None
 
     def get_pages_in_category(
         self, category_name: str
     ) -> list[str]:  # e.g. Category:abcd
-        """Gets the pages in each category from the MediaWiki API."""
-        res = requests.get(
-            f"{self.API_URL}?action=query&list=categorymembers&format=json&cmtype=page&cmtitle={quote_plus(category_name)}"
-        )
-        if res.ok:
-            try:
-                return [
-                    member["title"] for member in res.json["query"]["categorymembers"]  # type: ignore
-                ]
-            except:
-                raise ValueError("Malformed response.")
-        else:
-            raise ValueError("Category API request failed.")
+        """Gets the pages in a category from the article store's category index. Files and subcategories aren't included."""
+        return self.articles.category_members(category_name, exclude_namespaces=[6, 14])
+
+    def get_categories(self, title: str) -> list[str]:
+        """The categories a page is in, without the namespace."""
+        return self.articles.categories(title)
+
+    def get_character_categories(self, character_name: str) -> list[str]:
+        return self.get_categories(character_name)
+
+    def get_characters_in_category(self, category_name: str) -> list[str]:
+        return [
+            title
+            for title in self.articles.category_members(category_name)
+            if self.is_character_name(title)
+        ]
 
     def articles_starting_with(self, title) -> Iterable[WikiArticle]:
-        return (
-            page
-            for page_title, page in self.articles.items()
-            if page_title.startswith(title)
-        )
+        return (page for _, page in self.articles.items_starting_with(title))
 
     def transform_wikitext(
         self, title: str, wikitext: WikiText, remove_information: bool
     ):
+        # Consecutive template and wikilink transformers, waiting to be run in one traversal.
+        rewriters: list[NodeRewriter] = []
+
+        def run_rewriters():
+            if rewriters:
+                string = rewrite_wikitext(wikitext, rewriters)
+                if string is not None:
+                    wikitext.__init__(string)
+                rewriters.clear()
+
         for transformer in self.wikitext_transformers:
-            if transformer._removes_information == remove_information:
+            if transformer._removes_information != remove_information:
+                continue
+            if transformer._templates is not None or transformer._wikilinks is not None:
+                rewriters.append(
+                    NodeRewriter(
+                        partial(transformer, title),
+                        transformer._templates,
+                        transformer._wikilinks,
+                    )
+                )
+            else:
+                run_rewriters()
+                string = wikitext.string
                 transformer(title, wikitext)
-            # Hack to fix wikitext after transforming
-            wikitext.__init__(wikitext.string)
+                if wikitext.string != string:
+                    # Hack to fix wikitext after transforming
+                    wikitext.__init__(wikitext.string)
+        run_rewriters()
 
     def extract_sections(self, parsed: WikiText):
         sections = []
@@ -293,9 +852,10 @@ class MediaWiki(Source):
             if not found and found_level != None and section.level <= found_level:
                 found_level = None
                 found_priority = self.DEFAULT_SECTION_PRIORITY
+            # Converted to plain text when it's first needed.
             sections.append(
                 Section(
-                    re.sub("[\n]+", "\n", section.plain_text()),
+                    partial(section_plain_text, section.string, self.PLAIN_TEXT_CONVERTER),
                     found_priority,
                 )
             )
@@ -312,55 +872,268 @@ class MediaWiki(Source):
         return None
 
     def extract_image_url(self, title: str, parsed: WikiText):
-        image_name = self.extract_image_name(title, parsed)
+        return self.image_url(self.extract_image_name(title, parsed))
+
+    def image_url(self, image_name: str | None) -> str | None:
         if image_name is None:
             return None
         return f"{self.WIKI_URL}/Special:Redirect/file/{quote(image_name)}"
 
+    def extract_universe(self, title: str, parsed: WikiText) -> str | None:
+        return None
+
+    @property
+    def transformer_fingerprint(self) -> str:
+        """
+        Identifies the code that turns articles into characters (the transformer version of this source's classes,
+        the section priorities, the ignored names, the plain text converter and the wikitext parser),
+        so processed characters are invalidated when it changes.
+        """
+        if self._transformer_fingerprint is None:
+            versions = [
+                f"{cls.__name__}={cls.__dict__['TRANSFORMER_VERSION']}"
+                for cls in type(self).__mro__
+                if "TRANSFORMER_VERSION" in cls.__dict__
+            ]
+            self._transformer_fingerprint = content_key(
+                wtp.__version__,
+                self.PLAIN_TEXT_CONVERTER,
+                *versions,
+                sorted(self.SECTION_PRIORITY.items()),
+                self.DEFAULT_SECTION_PRIORITY,
+                sorted(self.IGNORE_CHARACTER_NAMES),
+            )
+        return self._transformer_fingerprint
+
+    def cached_expansion(self, key: str, expand: Callable[[], Any]) -> Any:
+        """
+        Build a value from other articles (e.g. a page combined from subpages), or reuse it if none of the articles it read have changed.
+        Values are kept in memory and in the character cache, so they're built once and shared between processes.
+        The articles read are recorded as dependencies of the article being processed.
+        """
+        key = content_key(self.SOURCE_ID, "expansion", key, self.transformer_fingerprint)
+        entry = self._expansions.get(key)
+        if entry is None and self.character_cache is not None:
+            entry = self.character_cache.get(key)
+        if entry is None or any(
+            self.articles.revision(title) != revision
+            for title, revision in entry["dependencies"]
+        ):
+            dependencies = self._dependencies
+            self._dependencies = {}
+            try:
+                value = expand()
+                entry = {
+                    "value": value,
+                    "dependencies": list(self._dependencies.items()),
+                }
+            finally:
+                self._dependencies = dependencies
+            if self.character_cache is not None:
+                self.character_cache.set(key, entry)
+        self._expansions[key] = entry
+        if self._dependencies is not None:
+            self._dependencies.update(entry["dependencies"])
+        return entry["value"]
+
+    def _process_article(self, article: WikiArticle, meta_only: bool) -> dict[str, Any]:
+        # Record the other articles read while processing, as the result depends on them too.
+        self._dependencies = {}
+        try:
+            parsed = wtp.parse(article.content)
+            # Apply wikitext transformers that don't remove information (e.g. to fix broken pages).
+            self.transform_wikitext(article.title, parsed, False)
+            aliases = self.extract_aliases(article.title, parsed)
+            image_name = self.extract_image_name(article.title, parsed)
+            universe = self.extract_universe(article.title, parsed)
+            sections = None
+            if not meta_only:
+                # Apply wikitext transformers that may remove information to prepare for plain text conversion.
+                self.transform_wikitext(article.title, parsed, True)
+                # Convert wikitext to plain text sections.
+                sections = self.extract_sections(parsed)
+            return {
+                "sections": sections,
+                "aliases": aliases,
+                "image_name": image_name,
+                "image_url": self.image_url(image_name),
+                "universe": universe,
+                "dependencies": list(self._dependencies.items()),
+            }
+        finally:
+            self._dependencies = None
+
+    def _get_processed_article(
+        self, article: WikiArticle, meta_only: bool
+    ) -> dict[str, Any]:
+        """Process an article, or load the result of processing the same revision from the character cache."""
+        if self.character_cache is None:
+            return self._process_article(article, meta_only)
+        key = content_key(
+            self.SOURCE_ID,
+            article.title,
+            article.revision.isoformat(),
+            self.transformer_fingerprint,
+        )
+        entry = self.character_cache.get(key)
+        if (
+            entry is not None
+            and (meta_only or entry["sections"] is not None)
+            and all(
+                self.articles.revision(title) == revision
+                for title, revision in entry["dependencies"]
+            )
+        ):
+            return entry
+        entry = self._process_article(article, meta_only)
+        if entry["sections"] is not None:
+            sections: list[Section] = entry["sections"]
+            # Sections that make it into abridged text with the default budget are cached as plain text.
+            # The rest are cached as wikitext, and converted whenever a larger budget needs them (each time they're loaded).
+            length = -1
+            for i in abridgement_order([section.priority for section in sections]):
+                length += len(sections[i].text) + 1
+                if MAX_CHARACTERS is not None and length > MAX_CHARACTERS:
+                    break
+            entry["sections"] = CompactSections(sections)
+        self.character_cache.set(key, entry)
+        return entry
+
     def character_from_article(
         self, name: str, article: WikiArticle, meta_only=False
     ) -> Character:
         if not self.is_valid_character(name, article):
             raise NotACharacterException(name)
-        parsed = wtp.parse(article.content)
-        # Apply wikitext transformers that don't remove information (e.g. to fix broken pages).
-        self.transform_wikitext(article.title, parsed, False)
-        aliases = self.extract_aliases(article.title, parsed)
-        image_url = self.extract_image_url(article.title, parsed)
-        sections = None
-        if not meta_only:
-            # Apply wikitext transformers that may remove information to prepare for plain text conversion.
-            self.transform_wikitext(article.title, parsed, True)
-            # Convert wikitext to plain text sections.
-            sections = self.extract_sections(parsed)
+        entry = self._get_processed_article(article, meta_only)
         return MediaWikiCharacter(
             CharacterId(self.SOURCE_ID, name),
             str(article.revision),
-            sections,
+            entry["sections"] if not meta_only else None,
             self,
-            aliases,
-            image_url=image_url,
+            self.harvest_aliases(name, article.title, entry["aliases"]),
+            image_url=entry["image_url"],
+            image_name=entry["image_name"],
+            universe=entry["universe"],
+        )
+
+    def harvest_aliases(self, name: str, title: str, aliases: list[str]) -> list[str]:
+        """A character's extracted aliases, plus its article's title and the main namespace pages that redirect to it."""
+        harvested = [title, *self.articles.redirects_to(title, namespace=0)]
+        return list(
+            dict.fromkeys([*aliases, *(alias for alias in harvested if alias != name)])
         )
 
     def resolve_redirects(self, article: WikiArticle) -> WikiArticle:
-        while article.content.startswith("#REDIRECT"):
-            article = self.get_article(wtp.parse(article.content).wikilinks[0].title)  # type: ignore
-            if article is None:
-                raise ValueError("Redirect goes to nonexistent page!")
-        return article
+        """The article at the end of an article's redirect chain, from the store's redirect index."""
+        title = self.articles.resolve_redirect(article.title)
+        if title == article.title:
+            return article
+        if title is None:
+            raise NotACharacterException(article.title)
+        return self.get_article(title)  # type: ignore
+
+    def get_precomputed_character(
+        self, character_name: str, meta_only=False
+    ) -> Character | None:
+        # Metadata is served from the manifest.
+        if not meta_only or self.manifest is None:
+            return None
+        row = self.manifest.extracted_row(character_name)
+        if row is None:
+            return None
+        image_name = self.manifest.image_names[row]
+        return MediaWikiCharacter(
+            CharacterId(self.SOURCE_ID, character_name),
+            self.manifest.revisions[row],  # type: ignore
+            None,
+            self,
+            list(self.manifest.aliases[row]),
+            image_url=self.image_url(image_name),
+            image_name=image_name,
+            universe=self.manifest.universes[row],
+        )
 
     def get_character(self, character_name: str, meta_only=False) -> Character:
+        character = self.get_precomputed_character(character_name, meta_only)
+        if character is not None:
+            return character
         article = self.get_article(character_name)
         if article == None:
             raise NotACharacterException(character_name)
         article = self.resolve_redirects(article)
         return self.character_from_article(character_name, article, meta_only=meta_only)
 
-    def get_character_length_estimate(self, character_name: str) -> int:
-        if character_name in self.articles:
-            return len(self.articles[character_name].content)
-        else:
+    def get_character_length_estimate(
+        self, character_name: str, abridged: bool = False
+    ) -> int:
+        row = self.manifest.row(character_name) if self.manifest else None
+        if abridged:
+            if row is not None and self.manifest.abridged_lengths[row] >= 0:  # type: ignore
+                return self.manifest.abridged_lengths[row]  # type: ignore
+            return super().get_character_length_estimate(character_name, abridged)
+        if row is not None:
+            return self.manifest.lengths[row]  # type: ignore
+        length = self.articles.content_length(character_name)
+        if length is None:
             raise NotACharacterException(character_name)
+        return length
+
+    def get_character_universe(self, character_name: str) -> str | None:
+        if self.manifest is not None:
+            row = self.manifest.extracted_row(character_name)
+            if row is not None:
+                return self.manifest.universes[row]
+        return self.get_character(character_name, meta_only=True).universe  # type: ignore
+
+    @property
+    def manifest_key(self) -> str:
+        return content_key(
+            self.SOURCE_ID,
+            self.articles.get_meta("modified"),
+            self.transformer_fingerprint,
+        )
+
+    def load_manifest(self):
+        """Load the saved manifest if it's up to date. Without one, it's only built if BUILD_MANIFEST is set."""
+        if self.manifest is not None and self.manifest.key == self.manifest_key:
+            return
+        self.manifest = CharacterManifest.load(self.manifest_path, self.manifest_key)
+        if self.manifest is None and BUILD_MANIFEST:
+            self.update_manifest()
+
+    def update_manifest(self):
+        """Build the manifest and save it, so it's loaded with the source until the store or transformers change."""
+        print("Building manifest...")
+        self.manifest = self.build_manifest()
+        self.manifest.save(self.manifest_path)
+        print("Built manifest!")
+
+    def build_manifest(self) -> CharacterManifest:
+        """Record the metadata of every main namespace article, extracting every valid character in batches."""
+        manifest = CharacterManifest(self.manifest_key)
+        # Lengths are recorded in the store's index when it's written. Only main namespace articles are read, to check their validity.
+        for title, article in self.articles.items(namespace=0):
+            manifest.add(
+                title,
+                self.is_valid_character(title, article),
+                self.articles.content_length(title),  # type: ignore
+            )
+        valid_titles = manifest.valid_titles()
+        for start in range(0, len(valid_titles), MANIFEST_BATCH_SIZE):
+            for character in self.get_characters(
+                valid_titles[start : start + MANIFEST_BATCH_SIZE],
+                return_exceptions=True,
+            ):
+                if isinstance(character, MediaWikiCharacter):
+                    manifest.set_extracted(
+                        character.name,
+                        character.revision,
+                        len(character.abridged_text()),
+                        character.aliases,
+                        character.image_name,
+                        character.universe,
+                    )
+        return manifest
 
     def is_valid_character(
         self,
@@ -370,19 +1143,16 @@ class MediaWiki(Source):
         return article.namespace == 0 and name not in self.IGNORE_CHARACTER_NAMES
 
     def _all_character_names(self) -> Iterable[str]:
-        for title, article in self.articles.items():
+        if self.manifest is not None:
+            return self.manifest.valid_titles()
+        return self._scan_character_names()
+
+    def _scan_character_names(self) -> Iterable[str]:
+        for title, article in self.articles.items(namespace=0):
             if self.is_valid_character(title, article):
                 yield article.title
 
-    def all_characters(self) -> Iterable[Character]:
-        for name in self.all_character_names():
-            article = self.articles[name]
-            yield self.character_from_article(name, article)
-
-    @wikitext_transformer
-    def remove_images(self, title, wikitext: WikiText):
-        def image_remover(wikilink: WikiLink):
-            if wikilink.title.startswith("File:"):
-                return ""
-
-        replace_wikilinks(wikitext, image_remover)
+    @wikitext_transformer(wikilinks=["File:"])
+    def remove_images(self, title, wikilink: WikiLink):
+        if wikilink.title.startswith("File:"):
+            return ""
@@ -4,10 +4,10 @@ from mediawiki import (
     MediaWiki,
     WikiArticle,
     combine_subpages,
-    replace_templates,
     wikitext_transformer,
 )
 from character import Character
+from functools import partial
 import wikitextparser as wtp
 from wikitextparser import Template, WikiText
 
@@ -33,6 +33,9 @@ class OnePieceWiki(MediaWiki):
     )
     DUMP_FORMAT = "7z"
 
+    # Bump when this source's transformers change.
+    TRANSFORMER_VERSION = 1
+
     # The "List of Canon Characters" isn't perfect.
     IGNORE_CHARACTER_NAMES = [
         "Impel Down",
@@ -133,10 +136,16 @@ class OnePieceWiki(MediaWiki):
         )
         if not tabs_template_used:
             return
-        character_name = tabs_template_used.normal_name()[: -len(" Tabs Top")]
-        tab_template = self.get_article(
-            f"Template:{tabs_template_used.normal_name()}"
-        ).content  # type: ignore
+        # Tabbed characters (e.g. Monkey D. Luffy) have many large subpages, so they're combined once per revision.
+        template_name = tabs_template_used.normal_name()
+        wikitext.string = wikitext.string + self.cached_expansion(  # type: ignore
+            f"Template:{template_name}", partial(self.combine_tabs, template_name)
+        )
+
+    def combine_tabs(self, template_name: str) -> str:
+        """Combine the subpages listed in a character's tabs template (e.g. "Nami Tabs Top")."""
+        character_name = template_name[: -len(" Tabs Top")]
+        tab_template = self.get_article(f"Template:{template_name}").content  # type: ignore
         parsed_tab_template = wtp.parse(tab_template)
         if any(
             template
@@ -159,18 +168,16 @@ class OnePieceWiki(MediaWiki):
                     if template.normal_name() == "Tabs"
                 ),
             )[1]
-        wikitext.string = wikitext.string + combine_subpages(1, subpages)  # type: ignore
-
-    @wikitext_transformer
-    def expand_nihongo(self, title: str, wikitext: WikiText):
-        def replace_nihongo(template: Template):
-            if template.normal_name(capitalize=True) == "Nihongo":
-                return template.arguments[0].value
+        return combine_subpages(1, subpages)  # type: ignore
 
-        replace_templates(wikitext, replace_nihongo)
+    @wikitext_transformer(templates=["Nihongo"])
+    def expand_nihongo(self, title: str, template: Template):
+        if template.normal_name(capitalize=True) == "Nihongo":
+            return template.arguments[0].value
 
     def _all_character_names(self) -> Iterable[str]:
-        character_names = set()
+        # Ordered, so characters are listed in the order of the lists.
+        character_names: dict[str, None] = {}
         for character_list in self.articles_starting_with(
             "List of Canon Characters/Names"
         ):
@@ -187,20 +194,20 @@ class OnePieceWiki(MediaWiki):
             data = parsed.get_tables()[0].data()
             for row in data:
                 link = wtp.parse(row[1]).wikilinks[0]
-                character_names.add(link.title)
+                character_names[link.title] = None
         for character in self.IGNORE_CHARACTER_NAMES:
-            character_names.discard(character)
-        return character_names
+            character_names.pop(character, None)
+        return character_names.keys()
 
     def is_valid_character(self, name: str, article: WikiArticle):
         return (
             super().is_valid_character(name, article)
-            and name in self.all_character_names()
+            and self.is_character_name(name)
         )
 
     def extract_image_name(self, title: str, parsed: WikiText) -> str | None:
         for location in self.IMAGE_LOCATIONS:
             location = location.format(title=title)
-            if ("File:" + location) in self.articles:
+            if self.has_article("File:" + location):
                 return location
         return None
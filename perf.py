@@ -0,0 +1,786 @@
+#!/usr/bin/python3
+"""Performance benchmarks for the ingest and preparation pipeline. See bench.py for model evals."""
+
+from argparse import ArgumentParser
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from xml.sax.saxutils import escape
+from typing import Iterator
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from os.path import join
+import gc
+import resource
+import os
+import random
+import time
+import tracemalloc
+
+from mediawiki import (
+    MediaWiki,
+    NAMESPACE,
+    WikiArticle,
+    replace_templates,
+    replace_wikilinks,
+)
+from plain_text import fast_plain_text
+from litellm import token_counter
+from wikitextparser import Template, WikiLink, WikiText
+import wikitextparser as wtp
+
+
+class BenchmarkWiki(MediaWiki):
+    SOURCE_ID = "benchmark"
+    DUMP_URL = ""
+    WIKI_URL = "https://benchmark.invalid/wiki"
+    SECTION_PRIORITY = {"introduction": 10, "history": 5}
+
+
+def synthetic_dump(pages: int, seed: int = 0) -> bytes:
+    """Generate a MediaWiki XML dump with `pages` pages of wikitext resembling character articles."""
+    return "".join(_synthetic_dump_parts(pages, seed)).encode()
+
+
+def write_synthetic_dump(path: str, pages: int, seed: int = 0):
+    with open(path, "w") as dump:
+        dump.writelines(_synthetic_dump_parts(pages, seed))
+
+
+def _synthetic_dump_parts(pages: int, seed: int) -> Iterator[str]:
+    rng = random.Random(seed)
+    words = ["power", "strength", "battle", "history", "pirate", "hero", "villain"]
+    namespaces = [0, 0, 0, 0, 6, 10, 14, 2]
+    yield (
+        f'<mediawiki xmlns="{NAMESPACE}" version="0.11" xml:lang="en">\n'
+        "  <siteinfo>\n    <sitename>Benchmark</sitename>\n  </siteinfo>\n"
+    )
+    for i in range(pages):
+        namespace = rng.choice(namespaces)
+        paragraphs = "\n\n".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(20, 200)))
+            + f" [[Page {rng.randint(0, pages)}|link]] {{{{m|Team {i}}}}}"
+            for _ in range(rng.randint(1, 8))
+        )
+        text = (
+            f"{{{{Infobox|name=Page {i}}}}}\n{paragraphs}\n==History==\n{paragraphs}\n"
+            f"[[Category:Group {rng.randint(0, 99)}]]"
+        )
+        yield (
+            "  <page>\n"
+            f"    <title>Page {i}</title>\n"
+            f"    <ns>{namespace}</ns>\n"
+            f"    <id>{i}</id>\n"
+            "    <revision>\n"
+            f"      <id>{i}</id>\n"
+            f"      <timestamp>20{rng.randint(10, 24)}-01-01T00:00:00Z</timestamp>\n"
+            f'      <text xml:space="preserve">{escape(text)}</text>\n'
+            "    </revision>\n"
+            "  </page>\n"
+        )
+    yield "</mediawiki>\n"
+
+
+def _load_dump(args) -> bytes:
+    if args.dump:
+        with open(args.dump, "rb") as dump:
+            return dump.read()
+    return synthetic_dump(args.synthetic)
+
+
+def bench_store(args):
+    """Time opening an article store and looking up a sample of articles."""
+    dump = _load_dump(args)
+    with TemporaryDirectory() as download_path:
+        wiki = BenchmarkWiki(download_path)
+        wiki.parse_from_stream(BytesIO(dump), processes=1)
+        titles = random.Random(0).sample(list(wiki.articles), args.lookups)
+        start = time.perf_counter()
+        wiki = BenchmarkWiki(download_path)
+        wiki.parse()
+        opened = time.perf_counter()
+        for title in titles:
+            wiki.get_article(title)
+            wiki.get_character_length_estimate(title)
+        end = time.perf_counter()
+        # Prefixes that each match a handful of titles, like subpages or character lists.
+        prefixes = [title + "1" for title in titles]
+        matches = sum(
+            1 for prefix in prefixes for _ in wiki.articles_starting_with(prefix)
+        )
+        prefixed = time.perf_counter()
+        categories = [f"Group {i}" for i in range(100)]
+        members = sum(len(wiki.get_pages_in_category(category)) for category in categories)
+        categorized = time.perf_counter()
+        print(f"Opened store in {(opened - start) * 1000:.1f}ms")
+        print(
+            f"Looked up {len(titles)} articles in {(end - opened) * 1000:.1f}ms "
+            f"({(end - opened) / len(titles) * 1e6:.0f}us/article)"
+        )
+        print(
+            f"Ran {len(prefixes)} prefix queries ({matches} articles) in {(prefixed - end) * 1000:.1f}ms "
+            f"({(prefixed - end) / len(prefixes) * 1e6:.0f}us/query)"
+        )
+        print(
+            f"Listed {len(categories)} categories ({members} pages) in {(categorized - prefixed) * 1000:.1f}ms "
+            f"({(categorized - prefixed) / len(categories) * 1e6:.0f}us/category)"
+        )
+
+
+def bench_characters(args):
+    """Time extracting every character in a batch with different numbers of processes."""
+    dump = _load_dump(args)
+    baseline = None
+    for processes in args.processes:
+        # A fresh download folder per run, so the processed character cache starts empty.
+        with TemporaryDirectory() as download_path:
+            wiki = BenchmarkWiki(download_path)
+            wiki.parse_from_stream(BytesIO(dump), processes=1)
+            names = wiki.all_character_names()
+            start = time.perf_counter()
+            characters = wiki.get_characters(names, processes=processes)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{processes} process(es): {len(characters)} characters in {elapsed:.2f}s "
+                f"({len(characters) / elapsed:.0f} characters/sec)"
+            )
+            result = [
+                (character.id, [(s.text, s.priority) for s in character.sections])  # type: ignore
+                for character in characters
+            ]
+        if baseline is None:
+            baseline = result
+        elif result != baseline:
+            raise AssertionError(f"Output with {processes} processes differs!")
+
+
+class _LegacySection:
+    """Section before the compact representation, for comparison."""
+
+    def __init__(self, text: str, priority: float):
+        self.text = text
+        self.priority = priority
+
+
+class _LegacyCharacter:
+    """Character before the compact representation, for comparison."""
+
+    def __init__(self, id, revision, sections, source, aliases):
+        self.id = id
+        self.sections = sections
+        self.revision = revision
+        self.source = source
+        self.aliases = aliases
+
+
+def _retained(build) -> tuple[int, list]:
+    """The memory held by what `build` returns, once whatever it used to build it is freed."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained, built
+
+
+def bench_character_memory(args):
+    """Measure the memory held by extracted characters, compact (and compressed) and as before."""
+    from character import Character, CompactSections, Section
+
+    dump = _load_dump(args)
+    with TemporaryDirectory() as download_path:
+        wiki = BenchmarkWiki(download_path)
+        wiki.parse_from_stream(BytesIO(dump), processes=1)
+        characters = wiki.get_characters(wiki.all_character_names(), processes=1)
+    characters = [
+        character for character in characters if not isinstance(character, Exception)
+    ]
+    # (id, revision, [(text, priority)], aliases), with every text converted.
+    contents = [
+        (
+            character.id,
+            character.revision,
+            [(section.text, section.priority) for section in character.sections],  # type: ignore
+            character.aliases,
+        )
+        for character in characters
+    ]
+    # Texts are copied, so each representation holds its own.
+    legacy, legacy_characters = _retained(
+        lambda: [
+            _LegacyCharacter(
+                id,
+                revision,
+                [_LegacySection(text.encode().decode(), p) for text, p in sections],
+                None,
+                aliases,
+            )
+            for id, revision, sections, aliases in contents
+        ]
+    )
+    print(f"{len(contents)} characters")
+    print(f"Before: {legacy / len(contents):.0f} bytes per character")
+    for compress in (False, True):
+        retained, compact_characters = _retained(
+            lambda: [
+                Character(
+                    id,
+                    revision,
+                    CompactSections(
+                        [Section(text.encode().decode(), p) for text, p in sections],
+                        compress=compress,
+                    ),
+                    None,
+                    aliases,
+                )
+                for id, revision, sections, aliases in contents
+            ]
+        )
+        for legacy_character, character in zip(legacy_characters, compact_characters):
+            assert [(s.text, s.priority) for s in legacy_character.sections] == [
+                (s.text, s.priority) for s in character.sections  # type: ignore
+            ]
+        print(
+            f"{'Compressed' if compress else 'Compact'}: {retained / len(contents):.0f} bytes per character "
+            f"({legacy / retained:.1f}x smaller)"
+        )
+
+
+def _legacy_abridged_text(character, model: str, max_tokens: int) -> str:
+    """Token-budgeted abridgement before per-section token counts: recount the whole text after leaving out each section."""
+    sections = [section for section in character.sections if section.priority > 0]
+    kept = sorted(
+        range(len(sections)), key=lambda i: (sections[i].priority, i), reverse=True
+    )
+    text = "\n".join(sections[i].text for i in sorted(kept))
+    while token_counter(model, text=text) > max_tokens:
+        kept.pop()
+        text = "\n".join(sections[i].text for i in sorted(kept))
+    return text
+
+
+def bench_abridge(args):
+    """Time abridging characters to a character budget and to a token budget, once sections' tokens are counted and before."""
+    from character import Character, CharacterId, Section
+
+    rng = random.Random(0)
+    words = ["pirate", "crew", "devil", "fruit", "marine", "sword", "battle", "Haki"]
+    characters = [
+        Character(
+            CharacterId("benchmark", f"Character {i}"),
+            "",
+            [
+                Section(
+                    " ".join(rng.choice(words) for _ in range(rng.randint(50, 500))),
+                    rng.choice([1, 2, 5, 10]),
+                )
+                for _ in range(args.sections)
+            ],
+            None,
+        )
+        for i in range(args.characters)
+    ]
+    # Roughly half of each character's text.
+    max_tokens = args.sections * 275 // 2
+    max_characters = max_tokens * 4
+    start = time.perf_counter()
+    for character in characters:
+        character.abridged_text(args.model, max_characters=max_characters)
+    by_characters = time.perf_counter()
+    texts = [
+        character.abridged_text(args.model, max_tokens=max_tokens) for character in characters
+    ]
+    counted = time.perf_counter()
+    for character in characters:
+        character.abridged_text(args.model, max_tokens=max_tokens)
+    by_tokens = time.perf_counter()
+    legacy_texts = [
+        _legacy_abridged_text(character, args.model, max_tokens) for character in characters
+    ]
+    end = time.perf_counter()
+    assert texts == legacy_texts
+    print(f"{len(characters)} characters with {args.sections} sections")
+    print(f"max_characters: {(by_characters - start) * 1000:.0f}ms")
+    print(
+        f"max_tokens: {(by_tokens - counted) * 1000:.0f}ms "
+        f"({(counted - by_characters) * 1000:.0f}ms counting sections' tokens the first time)"
+    )
+    print(f"max_tokens, recounting the whole text: {(end - by_tokens) * 1000:.0f}ms")
+
+
+def _legacy_replace_templates(wikitext: WikiText, replacer):
+    # The previous implementation, which rescans after every replacement.
+    index = 0
+    while True:
+        templates = wikitext.templates
+        if index >= len(templates):
+            break
+        template = templates[index]
+        replacement = replacer(template)
+        if replacement == None:
+            index += 1
+            continue
+        span = template.span
+        old_string = wikitext.string
+        wikitext.string = old_string[: span[0]] + replacement + old_string[span[1] :]
+
+
+def _legacy_replace_wikilinks(wikitext: WikiText, replacer):
+    index = 0
+    while True:
+        wikilinks = wikitext.wikilinks
+        if index >= len(wikilinks):
+            break
+        wikilink = wikilinks[index]
+        replacement = replacer(wikilink)
+        if replacement == None:
+            index += 1
+            continue
+        span = wikilink.span
+        old_string = wikitext.string
+        wikitext.string = old_string[: span[0]] + replacement + old_string[span[1] :]
+
+
+def _template_heavy_article(templates: int, rng: random.Random) -> str:
+    """Wikitext shaped like a large Marvel article: nested link, member and citation templates, and captioned images."""
+    parts = []
+    for i in range(templates):
+        parts.append(" ".join(rng.choice(["power", "hero", "villain"]) for _ in range(10)))
+        kind = rng.randrange(5)
+        if kind == 0:
+            parts.append(f"{{{{cl|Character {i} (Earth-616)|{{{{m|Team {i}}}}}}}}}")
+        elif kind == 1:
+            parts.append(f"<ref>{{{{cid|Comic Vol 1 {i}}}}}</ref>")
+        elif kind == 2:
+            parts.append(f"{{{{Nihongo|Name {i}|{{{{el|Earth-616|Place}}}}|Romaji}}}}")
+        elif kind == 3:
+            parts.append(f"[[File:Image {i}.png|thumb|A caption with [[Link {i}]]]]")
+        else:
+            parts.append(f"[[Article {i}|text]] {{{{Unknown|{i}}}}}")
+    return " ".join(parts)
+
+
+def _replace_link_template(template: Template):
+    name = template.normal_name()
+    if name == "m":
+        return template.arguments[0].plain_text()
+    elif name in ["cid", "cl", "el"]:
+        return template.arguments[-1].value
+    elif name == "Nihongo":
+        return template.arguments[0].value
+
+
+def _remove_image(wikilink: WikiLink):
+    if wikilink.title.startswith("File:"):
+        return ""
+
+
+def _rewrite_article(text: str, legacy: bool) -> str:
+    wikitext = wtp.parse(text)
+    if legacy:
+        _legacy_replace_templates(wikitext, _replace_link_template)
+        _legacy_replace_wikilinks(wikitext, _remove_image)
+    else:
+        replace_templates(wikitext, _replace_link_template)
+        replace_wikilinks(wikitext, _remove_image)
+    return wikitext.string
+
+
+def bench_rewrite(args):
+    """Compare the single-pass template and wikilink rewrite with the previous implementation on the largest articles."""
+    if args.dump:
+        with TemporaryDirectory() as download_path:
+            wiki = BenchmarkWiki(download_path)
+            with open(args.dump, "rb") as dump:
+                wiki.parse_from_stream(dump)
+            articles = sorted(
+                (article.content for article in wiki.articles.values()),
+                key=len,
+                reverse=True,
+            )[: args.articles]
+    else:
+        rng = random.Random(0)
+        articles = [
+            _template_heavy_article(args.templates, rng) for _ in range(args.articles)
+        ]
+    timings = {}
+    outputs = {}
+    for legacy in [True, False]:
+        start = time.perf_counter()
+        outputs[legacy] = [_rewrite_article(text, legacy) for text in articles]
+        timings[legacy] = time.perf_counter() - start
+    print(
+        f"{len(articles)} articles ({sum(len(text) for text in articles) / len(articles) / 1024:.0f} KiB on average)"
+    )
+    print(f"Rescanning: {timings[True]:.2f}s")
+    print(f"Single pass: {timings[False]:.2f}s ({timings[True] / timings[False]:.1f}x)")
+    if outputs[True] != outputs[False]:
+        raise AssertionError("Single pass output differs from rescanning!")
+
+
+# Wikitext the synthetic dump doesn't cover, including constructs the fast converter leaves to wikitextparser.
+PLAIN_TEXT_CORPUS = [
+    # Bold and italics
+    "'''Nami''' is the ''navigator'' of the '''''Straw Hat Pirates'''''.",
+    "An ''unclosed italic\nand a '''bold''' line.",
+    "'''Bold with ''italic'' inside'''",
+    "Five quotes '''''x''''' and an apostrophe's ''italic''",
+    "Odd runs: '''bold'' and ''italic'''",
+    "''''four quotes''''",
+    "L'''apostrophe''' 'single' quotes",
+    # Links
+    "[[Monkey D. Luffy]] and [[Roronoa Zoro|Zoro]]",
+    "[[Nami#History|her past]], [[:Category:Pirates]] and [[''Going Merry'']]",
+    "[[File:Nami.png|thumb|Nami]] after the image",
+    "[[Image:Map.jpg]] and [[Media:Song.ogg|song]]",
+    "[[Going Merry|the '''Merry''']]",
+    "[[Foo|<small>bar</small>]], [[Foo|bar<br>baz]] and x [[Foo|a<sup>1</sup>]] y",
+    "[[Foo|a ''b'' c'']] and [[Foo|'x''']]",
+    "[[Broken link",
+    "Stray ]] brackets",
+    # Refs
+    "Nami is a navigator.<ref>Chapter 8</ref>",
+    '<ref name="sbs">SBS Volume 4</ref> and <ref name="sbs" />',
+    "<ref>Nested [[Link|text]] and ''italic''</ref>",
+    "Text<references/> and <references />",
+    # Templates, including nested ones
+    "{{Qquote|I'm a navigator}} Nami",
+    "{{Outer|{{Inner|x}}|y}} after",
+    "{{Nihongo|Nami|ナミ}} is {{Unclosed",
+    "Closing only }} here",
+    "{{#if:x|y|z}}",
+    "{{ }}",
+    # Tags and comments
+    "<small>small</small> <sup>1</sup> <br> <br/> line",
+    "<span style='color:red'>red</span>",
+    '<span style="color:red">red</span>',
+    "<b><i>nested tags</i></b>",
+    "<div>unclosed div",
+    "<!-- comment -->visible<!-- another\nline -->",
+    "<!-- unclosed comment",
+    "<nowiki>''raw''</nowiki>",
+    "<gallery>\nFile:A.png\n</gallery>",
+    # Lists, headings and entities
+    "==Abilities==\n* Navigation\n** Weather\n# Numbered\n: Indented\n; Term : definition",
+    "===History===\nLine one\n\nLine two",
+    "Entities: &amp; &lt;b&gt; &nbsp; &#039; &hellip;",
+    # Constructs left to wikitextparser
+    '{| class="wikitable"\n|-\n| Cell || Cell\n|}',
+    "{{{parameter|default}}}",
+    "[https://onepiece.fandom.com External link] and [//example.com protocol-relative]",
+    "Bare https://example.com URL",
+    "[mailto:someone@example.com mail]",
+    "\x01control characters\x02",
+]
+
+
+def check_plain_text_corpus():
+    """Check that the fast converter gives wikitextparser's output (or falls back to it) on every corpus entry."""
+    differences = []
+    supported = 0
+    for wikitext in PLAIN_TEXT_CORPUS:
+        text = fast_plain_text(wikitext)
+        if text is None:
+            continue
+        supported += 1
+        expected_text = wtp.parse(wikitext).plain_text()
+        if text != expected_text:
+            differences.append((wikitext, text, expected_text))
+    for wikitext, text, expected_text in differences:
+        print(f"Wikitext: {wikitext!r}\nFast: {text!r}\nExpected: {expected_text!r}")
+    if differences:
+        raise AssertionError(f"{len(differences)} corpus entries differ!")
+    print(f"Corpus: {len(PLAIN_TEXT_CORPUS)} entries, {supported} supported by the fast converter, all equivalent")
+
+
+def bench_plain_text(args):
+    """
+    Compare the fast plain text converter with wikitextparser on every main namespace section, once link templates and images are handled.
+    Any difference is reported, so this doubles as an equivalence check on real dumps. The fixed corpus is checked first.
+    """
+    check_plain_text_corpus()
+    dump = _load_dump(args)
+    with TemporaryDirectory() as download_path:
+        wiki = BenchmarkWiki(download_path)
+        wiki.parse_from_stream(BytesIO(dump), processes=1)
+        sections = [
+            section
+            for article in wiki.articles.values()
+            if article.namespace == 0
+            for section in wtp.parse(_rewrite_article(article.content, False)).get_sections(
+                include_subsections=False
+            )
+        ]
+    start = time.perf_counter()
+    expected = [section.plain_text() for section in sections]
+    converted = time.perf_counter()
+    fast = [fast_plain_text(section.string) for section in sections]
+    end = time.perf_counter()
+    size = sum(len(section.string) for section in sections) / 1024 / 1024
+    supported = sum(text is not None for text in fast)
+    print(f"{len(sections)} sections ({size:.1f} MiB), {supported} supported by the fast converter")
+    print(f"wikitextparser: {converted - start:.2f}s ({size / (converted - start):.1f} MiB/s)")
+    print(
+        f"Fast converter: {end - converted:.2f}s ({size / (end - converted):.1f} MiB/s, "
+        f"{(converted - start) / (end - converted):.1f}x, not counting fallbacks)"
+    )
+    differences = [
+        (section.string, text, expected_text)
+        for section, text, expected_text in zip(sections, fast, expected)
+        if text is not None and text != expected_text
+    ]
+    for wikitext, text, expected_text in differences[:5]:
+        print(f"Wikitext: {wikitext!r}\nFast: {text!r}\nExpected: {expected_text!r}")
+    if differences:
+        raise AssertionError(f"{len(differences)} sections differ!")
+
+
+def _one_piece_articles(characters: int, rng: random.Random) -> Iterator[WikiArticle]:
+    """A One Piece store's worth of articles: character list pages, characters, and as many other articles."""
+    revision = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    names = [f"Character {i}" for i in range(characters)]
+    for letter in range(26):
+        rows = "\n".join(
+            f"|-\n| {i} || [[{name}]] || Chapter {i}"
+            for i, name in enumerate(names)
+            if i % 26 == letter
+        )
+        yield WikiArticle(
+            f"List of Canon Characters/Names {chr(ord('A') + letter)}", revision, rows, 0
+        )
+    for i, name in enumerate(names):
+        yield WikiArticle(name, revision, f"{name} is a pirate.", 0)
+        yield WikiArticle(f"Location {i}", revision, "A place.", rng.choice([0, 0, 6, 14]))
+
+
+def bench_names(args):
+    """Time building the character name index, validating every article, and filtering characters for a run."""
+    from one_piece import OnePieceWiki
+    from source_manager import SourceManager
+    from generator import Generator
+    from character_filter import SourceFilter
+
+    with TemporaryDirectory() as download_path:
+        wiki = OnePieceWiki(download_path)
+        wiki.write_store(_one_piece_articles(args.characters, random.Random(0)))
+        articles = list(wiki.articles.items())
+
+        start = time.perf_counter()
+        names = list(wiki._all_character_names())
+        listed = time.perf_counter()
+        wiki.character_name_set
+        indexed = time.perf_counter()
+        valid = sum(wiki.is_valid_character(title, article) for title, article in articles)
+        validated = time.perf_counter()
+        # What validating cost before the index: a copy of the name list per article.
+        legacy_valid = sum(
+            article.namespace == 0 and title in names.copy() for title, article in articles
+        )
+        legacy_validated = time.perf_counter()
+
+        source_manager = SourceManager(download_path)
+        source_manager.sources[wiki.SOURCE_ID] = wiki
+        generator = Generator(SourceFilter(wiki.SOURCE_ID), None, None, {})  # type: ignore
+        filtered = generator.filter_characters(source_manager)
+        end = time.perf_counter()
+
+        assert valid == legacy_valid == len(names) == len(filtered)
+        print(f"{len(names)} characters, {len(articles)} articles")
+        print(f"_all_character_names: {(listed - start) * 1000:.1f}ms")
+        print(f"Building the index: {(indexed - listed) * 1000:.1f}ms")
+        print(
+            f"is_valid_character on every article: {(validated - indexed) * 1000:.1f}ms "
+            f"(copying the name list: {(legacy_validated - validated) * 1000:.1f}ms)"
+        )
+        print(f"Generator.filter_characters: {(end - legacy_validated) * 1000:.1f}ms")
+
+
+class _LegacyCharacterId:
+    """CharacterId before interning, for comparison."""
+
+    def __init__(self, source_id: str, name: str):
+        self.source_id = source_id
+        self.name = name
+
+    def __str__(self):
+        return f"{self.source_id}/{self.name}"
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, _LegacyCharacterId):
+            return False
+        return self.source_id == other.source_id and self.name == other.name
+
+    @staticmethod
+    def from_str(s: str):
+        return _LegacyCharacterId(*s.split("/", 1))
+
+
+def _time_ids(id_class, keys: list[str]) -> list[float]:
+    start = time.perf_counter()
+    ids = [id_class.from_str(key) for key in keys]
+    parsed = time.perf_counter()
+    ratings = dict((character_id, 1000.0) for character_id in ids)
+    built = time.perf_counter()
+    filtered = set(ids)
+    found = sum(character_id in filtered for character_id in ids)
+    looked_up = time.perf_counter()
+    ratings_sum = sum(ratings[id_class.from_str(key)] for key in keys)
+    end = time.perf_counter()
+    assert found == len(keys) and ratings_sum == 1000.0 * len(keys)
+    return [parsed - start, built - parsed, looked_up - built, end - looked_up]
+
+
+def bench_ids(args):
+    """Time parsing, hashing and looking up character ids, as ratings and filters do, against the uninterned ids."""
+    from character import CharacterId
+
+    keys = [f"source {i % 4}/Character {i}" for i in range(args.ids)]
+    # Interned ids are only created once, so time them warm, as in a long run.
+    _time_ids(CharacterId, keys)
+    steps = ["from_str", "Building a dict", "Set membership", "from_str + dict lookup"]
+    for step, legacy, interned in zip(
+        steps, _time_ids(_LegacyCharacterId, keys), _time_ids(CharacterId, keys)
+    ):
+        print(
+            f"{step}: {interned * 1000:.1f}ms "
+            f"(uninterned: {legacy * 1000:.1f}ms, {legacy / interned:.1f}x)"
+        )
+
+
+def _parse_file(dump_path: str, download_path: str, processes: int):
+    with open(dump_path, "rb") as dump:
+        BenchmarkWiki(download_path).parse_from_stream(dump, processes=processes)
+
+
+def bench_memory(args):
+    """Measure peak RSS while parsing dumps of increasing size, each in a fresh process."""
+    for pages in sorted(args.pages):
+        with TemporaryDirectory() as download_path:
+            dump_path = join(download_path, "dump.xml")
+            write_synthetic_dump(dump_path, pages)
+            process = get_context("spawn").Process(
+                target=_parse_file, args=(dump_path, download_path, args.processes)
+            )
+            start = time.perf_counter()
+            process.start()
+            process.join()
+            elapsed = time.perf_counter() - start
+            # ru_maxrss is the peak of the largest child waited for so far, so sizes are run in increasing order.
+            peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            size = os.path.getsize(dump_path) / 1024 / 1024
+            print(
+                f"{pages} pages ({size:.0f} MiB): peak RSS {peak:.0f} MiB, {elapsed:.1f}s"
+            )
+
+
+def bench_parse(args):
+    dump = _load_dump(args)
+    print(f"Dump size: {len(dump) / 1024 / 1024:.1f} MiB")
+    baseline = None
+    for processes in args.processes:
+        with TemporaryDirectory() as download_path:
+            wiki = BenchmarkWiki(download_path)
+            start = time.perf_counter()
+            wiki.parse_from_stream(BytesIO(dump), processes=processes)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{processes} process(es): {len(wiki.articles)} articles in {elapsed:.2f}s "
+                f"({len(wiki.articles) / elapsed:.0f} articles/sec)"
+            )
+            result = [
+                (a.title, a.revision, a.namespace, a.content)
+                for a in wiki.articles.values()
+            ]
+        if baseline is None:
+            baseline = result
+        elif result != baseline:
+            raise AssertionError(f"Output with {processes} processes differs!")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="perf", description="Run performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_parse = subparsers.add_parser("parse", help="Dump parsing throughput")
+    parser_parse.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_parse.add_argument("-synthetic", type=int, default=20000)
+    parser_parse.add_argument(
+        "-processes",
+        type=int,
+        nargs="+",
+        default=sorted(set([1, 2, 4, os.cpu_count() or 1])),
+    )
+    parser_store = subparsers.add_parser("store", help="Article store lookup latency")
+    parser_store.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_store.add_argument("-synthetic", type=int, default=20000)
+    parser_store.add_argument("-lookups", type=int, default=500)
+    parser_characters = subparsers.add_parser(
+        "characters", help="Batch character extraction throughput"
+    )
+    parser_characters.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_characters.add_argument("-synthetic", type=int, default=2000)
+    parser_characters.add_argument(
+        "-processes",
+        type=int,
+        nargs="+",
+        default=sorted(set([1, 2, 4, os.cpu_count() or 1])),
+    )
+    parser_character_memory = subparsers.add_parser(
+        "charmemory", help="Memory held by extracted characters"
+    )
+    parser_character_memory.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_character_memory.add_argument("-synthetic", type=int, default=2000)
+    parser_abridge = subparsers.add_parser(
+        "abridge", help="Abridging characters to character and token budgets"
+    )
+    parser_abridge.add_argument("-characters", type=int, default=200)
+    parser_abridge.add_argument("-sections", type=int, default=12)
+    parser_abridge.add_argument("-model", default="gpt-4o-mini")
+    parser_rewrite = subparsers.add_parser(
+        "rewrite", help="Template and wikilink rewriting on the largest articles"
+    )
+    parser_rewrite.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_rewrite.add_argument("-articles", type=int, default=10)
+    parser_rewrite.add_argument(
+        "-templates", type=int, default=500, help="Templates per synthetic article"
+    )
+    parser_plain_text = subparsers.add_parser(
+        "plaintext", help="Plain text conversion throughput and equivalence"
+    )
+    parser_plain_text.add_argument("-dump", help="Path to an uncompressed XML dump")
+    parser_plain_text.add_argument("-synthetic", type=int, default=5000)
+    parser_names = subparsers.add_parser(
+        "names", help="Character name index and validation"
+    )
+    parser_names.add_argument("-characters", type=int, default=5000)
+    parser_ids = subparsers.add_parser("ids", help="Character id hashing and lookup")
+    parser_ids.add_argument("-ids", type=int, default=100000)
+    parser_memory = subparsers.add_parser("memory", help="Peak RSS while parsing")
+    parser_memory.add_argument(
+        "-pages", type=int, nargs="+", default=[5000, 20000, 80000]
+    )
+    parser_memory.add_argument("-processes", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "parse":
+        bench_parse(args)
+    elif args.command == "store":
+        bench_store(args)
+    elif args.command == "characters":
+        bench_characters(args)
+    elif args.command == "charmemory":
+        bench_character_memory(args)
+    elif args.command == "abridge":
+        bench_abridge(args)
+    elif args.command == "rewrite":
+        bench_rewrite(args)
+    elif args.command == "plaintext":
+        bench_plain_text(args)
+    elif args.command == "names":
+        bench_names(args)
+    elif args.command == "ids":
+        bench_ids(args)
+    elif args.command == "memory":
+        bench_memory(args)
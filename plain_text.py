@@ -0,0 +1,201 @@
+"""
+A fast wikitext to plain text converter for section extraction.
+It covers the wikitext left in sections once a source's transformers have run (links, leftover templates, formatting, refs and simple tags),
+and gives the same result as wikitextparser's `plain_text`. Anything else (tables, external links, raw content tags...) is left to wikitextparser.
+"""
+
+from __future__ import annotations
+from html import unescape
+import re
+
+# Same as wikitextparser's.
+FILE_EXTENSIONS = frozenset(
+    "bmp djvu gif iff jb2 jp2 jpc jpeg jpg jpx mid mka mkv mp3 oga ogg ogv ogx opus pdf png psd spx stl svg swc swf tif tiff wbmp webm webp wmf xbm xcf".split()
+)
+
+# HTML tags whose markup is removed and whose content is kept. Void tags don't need to be closed.
+TAGS = frozenset(
+    "small big sup sub s u b i span div center blockquote font abbr strike del ins em strong tt p".split()
+)
+VOID_TAGS = frozenset(["br", "hr"])
+
+# Wikitext only wikitextparser converts: tables, parameters and external links.
+UNSUPPORTED = ["{|", "{{{", "}}}", "\x01", "\x02"]
+EXTERNAL_LINK = re.compile(r"\[(?!\[)(?<!\[\[)(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)")
+COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+BRACES = re.compile(r"\{\{|\}\}")
+TEMPLATE_NAME = re.compile(r"\s*[^\[\]{}<>|\s]+(?:[^\S\n]+[^\[\]{}<>|\s]+)*\s*(?=\||\}\})")
+REF = re.compile(
+    r"<ref(?:\s[^<>]*?)?\s*(?:/>|>(.*?)</ref\s*>)", re.IGNORECASE | re.DOTALL
+)
+REFERENCES = re.compile(r"<references(?:\s[^<>]*?)?\s*/>", re.IGNORECASE)
+TAG = re.compile(r"<(/?)([a-zA-Z]+)(\s[^<>]*?)?\s*(/?)>")
+MARKUP = re.compile(r"<[a-zA-Z/!]")
+WIKILINK = re.compile(r"\[\[([^\[\]{}<>|\n]*)(?:\|([^\[\]]*))?\]\]")
+# Refs and links, which are converted separately.
+NESTED_MARKUP = re.compile(f"{REF.pattern}|{WIKILINK.pattern}", re.IGNORECASE | re.DOTALL)
+QUOTES = re.compile(r"''+")
+BOLD = re.compile(r"'''([^'\n].*?)(?:'''|$)")
+ITALIC = re.compile(r"''([^'\n].*?)(?:''|$)")
+
+# Stands in for removed markup, which still separates apostrophes.
+REMOVED = "\x01"
+# Stands in for links and refs while the text around them is converted.
+NESTED = "\x02"
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _remove_templates(wikitext: str) -> str:
+    parts = []
+    depth = 0
+    start = 0
+    for match in BRACES.finditer(wikitext):
+        if match.group() == "{{":
+            if not TEMPLATE_NAME.match(wikitext, match.end()):
+                raise _Unsupported()
+            if depth == 0:
+                parts.append(wikitext[start : match.start()])
+                parts.append(REMOVED)
+            depth += 1
+        else:
+            if depth == 0:
+                raise _Unsupported()
+            depth -= 1
+            if depth == 0:
+                start = match.end()
+    if depth:
+        raise _Unsupported()
+    parts.append(wikitext[start:])
+    return "".join(parts)
+
+
+def _remove_tags(wikitext: str) -> str:
+    """Remove the markup of HTML tags, keeping their content."""
+    open_tag = None
+    for match in TAG.finditer(wikitext):
+        closing, name, attributes, self_closing = match.groups()
+        name = name.lower()
+        if attributes and "'" in attributes:
+            raise _Unsupported()
+        if name in VOID_TAGS and not closing:
+            continue
+        if name not in TAGS or (closing and self_closing):
+            raise _Unsupported()
+        if self_closing:
+            continue
+        if closing:
+            if open_tag != name:
+                raise _Unsupported()
+            open_tag = None
+        elif open_tag is not None:
+            # Nested tags aren't supported.
+            raise _Unsupported()
+        else:
+            open_tag = name
+    if open_tag is not None:
+        raise _Unsupported()
+    wikitext = TAG.sub(REMOVED, wikitext)
+    if MARKUP.search(wikitext):
+        raise _Unsupported()
+    return wikitext
+
+
+def _hide(line: str, spans: list[tuple[int, int]], replacement: str = "_") -> str:
+    """Replace each character in the (ordered) spans."""
+    parts = []
+    position = 0
+    for start, end in spans:
+        parts.append(line[position:start])
+        parts.append(replacement * (end - start))
+        position = end
+    parts.append(line[position:])
+    return "".join(parts)
+
+
+def _remove_quotes(wikitext: str) -> str:
+    """Remove bold and italic markup, line by line, like wikitextparser."""
+    lines = wikitext.split("\n")
+    for i, line in enumerate(lines):
+        if "''" not in line:
+            continue
+        runs = [len(run) for run in QUOTES.findall(line)]
+        if any(length > 3 for length in runs):
+            raise _Unsupported()
+        # With an odd number of both, MediaWiki turns one bold into an apostrophe and an italic.
+        if runs.count(2) % 2 and runs.count(3) % 2:
+            raise _Unsupported()
+        markup = []
+        for bold in BOLD.finditer(line):
+            markup += [(bold.start(), bold.start(1)), (bold.end(1), bold.end())]
+        # Italics are found once bold markup is hidden.
+        for italic in ITALIC.finditer(_hide(line, markup) if markup else line):
+            markup += [(italic.start(), italic.start(1)), (italic.end(1), italic.end())]
+        lines[i] = _hide(line, sorted(markup), "")
+    return "\n".join(lines)
+
+
+def _wikilink_text(wikilink: str) -> str:
+    target, text = WIKILINK.fullmatch(wikilink).groups()  # type: ignore
+    title = target.partition("#")[0]
+    if (
+        title[:1] != ":"
+        and title.partition(":")[2].rpartition(".")[2] in FILE_EXTENSIONS
+    ):
+        return ""
+    # Links have their own tags and bold and italic markup.
+    text = target if text is None else text
+    if "<" in text:
+        text = _remove_tags(text)
+    return _remove_quotes(text) if "''" in text else text
+
+
+def _convert(wikitext: str) -> str:
+    """Convert wikitext without comments or templates. Refs and links are converted separately, like wikitextparser does."""
+    nested = []
+
+    def convert_nested(match: re.Match) -> str:
+        if match.group().startswith("[["):
+            nested.append(_wikilink_text(match.group()))
+        else:
+            nested.append(_convert(match.group(1) or ""))
+        return NESTED
+
+    if "<" in wikitext or "[[" in wikitext:
+        wikitext = NESTED_MARKUP.sub(convert_nested, wikitext)
+    if "<" in wikitext:
+        wikitext = REFERENCES.sub(REMOVED, wikitext)
+    if "[[" in wikitext or "]]" in wikitext:
+        raise _Unsupported()
+    if "<" in wikitext:
+        wikitext = _remove_tags(wikitext)
+    if "''" in wikitext:
+        wikitext = _remove_quotes(wikitext)
+    if nested:
+        parts = wikitext.split(NESTED)
+        wikitext = "".join(part + text for part, text in zip(parts, [*nested, ""]))
+    return wikitext
+
+
+def fast_plain_text(wikitext: str) -> str | None:
+    """
+    Convert wikitext to plain text, like wikitextparser's `plain_text`.
+    None if the wikitext uses something this converter doesn't support.
+    """
+    if any(markup in wikitext for markup in UNSUPPORTED) or EXTERNAL_LINK.search(
+        wikitext
+    ):
+        return None
+    try:
+        if "<!--" in wikitext:
+            wikitext = COMMENT.sub("", wikitext)
+            if "<!--" in wikitext:
+                return None
+        if "{{" in wikitext or "}}" in wikitext:
+            wikitext = _remove_templates(wikitext)
+        wikitext = _convert(wikitext).replace(REMOVED, "")
+    except _Unsupported:
+        return None
+    return unescape(wikitext) if "&" in wikitext else wikitext
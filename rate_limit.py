@@ -1,5 +1,4 @@
 from __future__ import annotations
-from typing import Awaitable
 from litellm import ModelResponse, token_counter, get_max_tokens, acompletion
 from config import (
     MAX_OUTPUT_TOKENS_ESTIMATE,
@@ -9,125 +8,147 @@ from config import (
     EXECUTE_DELAY,
 )
 import asyncio
-import traceback
-import sys
-from aiolimiter import AsyncLimiter
+import time
 
 
-# class _Waiter:
-#     def __init__(self, tokens: int):
-#         self.tokens = tokens
-#         self.future = asyncio.get_running_loop().create_future()
+class _Bucket:
+    """A leaky bucket: up to `capacity` units can be used at once, and `capacity` units leak out every `interval` seconds."""
 
-#     def start(self, executor: _Executor):
-#         self.future.set_result(executor)
+    def __init__(self, capacity: float, interval: float):
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self.level = 0.0
+        self._last_leak = time.monotonic()
 
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(self.level - (now - self._last_leak) * self.rate, 0)
+        self._last_leak = now
 
-# class _Executor:
-#     def __init__(self, tokens: int, interval: float):
-#         self.tokens = tokens
-#         self.interval = interval
-#         self.future = asyncio.get_running_loop().create_future()
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` fits. Amounts larger than the bucket fit once it's empty."""
+        self._leak()
+        excess = self.level + min(amount, self.capacity) - self.capacity
+        return max(excess / self.rate, 0)
 
-#     @property
-#     def done(self):
-#         return self.future.done()
+    def add(self, amount: float):
+        self._leak()
+        self.level = max(self.level + amount, 0)
 
-#     async def _end(self):
-#         await asyncio.sleep(self.interval)
-#         self.future.set_result(self)
 
-#     def end(self):
-#         self._end_task = asyncio.get_running_loop().create_task(self._end())
+class Reservation:
+    """Tokens reserved for a request, which can be corrected once its actual usage is known."""
+
+    def __init__(self, rate_limit: RateLimit, model: str, prompt_tokens: int, tokens: int):
+        self.rate_limit = rate_limit
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.tokens = tokens
+
+    def reconcile(self, response: ModelResponse):
+        """Replace the reservation with the tokens the response actually used, refunding (or charging) the difference."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.rate_limit._reconcile(self, usage.total_tokens, usage.completion_tokens)
+        self.tokens = usage.total_tokens
+
+    def release(self):
+        """Refund the output tokens reserved for a request that failed. Its prompt tokens are kept, as the provider may have counted them."""
+        self.rate_limit._release(self)
+        self.tokens = self.prompt_tokens
 
 
 class RateLimit:
-    # async def _manage_executing(self):
-    #     try:
-    #         total_tokens_executing = 0
-    #         while True:
-    #             if len(self._executing) == 0:
-    #                 if len(self._waiting) == 0:
-    #                     await self._new_waiting
-    #             if len(self._executing) != 0:
-    #                 done: set[Awaitable[_Executor]]
-    #                 done, pending = await asyncio.wait(
-    #                     [executor.future for executor in self._executing],
-    #                     return_when="FIRST_COMPLETED",
-    #                 )
-    #                 for finished_executor in done:
-    #                     executor = await finished_executor
-    #                     total_tokens_executing -= executor.tokens
-    #                     self._executing.remove(executor)
-    #             for waiting in self._waiting.copy():
-    #                 if (
-    #                     self.requests_per_interval is not None
-    #                     and len(self._executing) >= self.requests_per_interval
-    #                 ):
-    #                     break
-    #                 if self.tokens_per_interval is None or (
-    #                     total_tokens_executing + waiting.tokens
-    #                     <= self.tokens_per_interval
-    #                 ):
-    #                     total_tokens_executing += waiting.tokens
-    #                     finished_executor = _Executor(waiting.tokens, self.interval)
-    #                     self._executing.append(finished_executor)
-    #                     waiting.start(finished_executor)
-    #                     self._waiting.remove(waiting)
-    #                     if self.execute_delay:
-    #                         await asyncio.sleep(self.execute_delay)
-    #     except Exception as e:
-    #         traceback.print_exception(e)
-    #         sys.exit(1)
+    """
+    Limits requests per interval and tokens per interval at the same time (None disables either).
+    Requests reserve their input tokens and an estimate of their output tokens (the average so far for the model,
+    or its maximum until a response is seen), and reservations are reconciled with the usage in each response.
+    Waiting requests are started in order, at least `execute_delay` seconds apart.
+    """
 
     def __init__(
         self,
         interval: float = INTERVAL_SECS,
-        requests_per_interval: int = REQUESTS_PER_INTERVAL,
-        tokens_per_interval: int = TOKENS_PER_INTERVAL,
+        requests_per_interval: int | None = REQUESTS_PER_INTERVAL,
+        tokens_per_interval: int | None = TOKENS_PER_INTERVAL,
         execute_delay: float | None = EXECUTE_DELAY,
     ):
-        # self.interval = 1
-        # self.requests_per_interval = requests_per_interval
-        # self.tokens_per_interval = tokens_per_interval
-        # self.execute_delay = execute_delay
-        # self._waiting = []
-        # self._executing = []
-        # self._new_waiting = asyncio.get_running_loop().create_future()
-        # self._task = (
-        #     asyncio.get_running_loop()
-        #     .create_task(self._manage_executing())
-        #     .add_done_callback
-        # )
-
-        # TODO: Add requests per minute check
-        self.limiter = AsyncLimiter(tokens_per_interval, interval)
-
-    # async def _start_waiting(self, waiter: _Waiter):
-    #     self._waiting.append(waiter)
-    #     self._new_waiting.set_result(True)
-    #     self._new_waiting = asyncio.get_running_loop().create_future()
-    #     return await waiter.future
-
-    async def rate_limit_completion(self, **completion_args):
-        max_tokens_estimate = (
-            get_max_tokens(completion_args["model"]) or MAX_OUTPUT_TOKENS_ESTIMATE
+        self.requests = (
+            _Bucket(requests_per_interval, interval) if requests_per_interval else None
         )
-        input_tokens = token_counter(
-            completion_args["model"], messages=completion_args["messages"]
+        self.tokens = _Bucket(tokens_per_interval, interval) if tokens_per_interval else None
+        self.execute_delay = execute_delay
+        # Held by the first waiting request, so requests start in order.
+        self._lock = asyncio.Lock()
+        # Set when reservations are refunded or reconciled.
+        self._changed = asyncio.Event()
+        self._last_start = 0.0
+        # Completion tokens and responses seen, by model.
+        self._completion_tokens: dict[str, tuple[int, int]] = {}
+
+    def completion_tokens_estimate(self, model: str) -> int:
+        seen = self._completion_tokens.get(model)
+        if seen is not None:
+            tokens, responses = seen
+            return round(tokens / responses)
+        try:
+            return get_max_tokens(model) or MAX_OUTPUT_TOKENS_ESTIMATE
+        except Exception:
+            return MAX_OUTPUT_TOKENS_ESTIMATE
+
+    async def reserve(self, model: str, prompt_tokens: int) -> Reservation:
+        """Wait until a request with `prompt_tokens` input tokens can start, and reserve its tokens."""
+        async with self._lock:
+            while True:
+                # Estimated again each time, as responses seen while waiting improve the estimate.
+                tokens = prompt_tokens + self.completion_tokens_estimate(model)
+                wait_time = max(
+                    self.requests.wait_time(1) if self.requests else 0,
+                    self.tokens.wait_time(tokens) if self.tokens else 0,
+                    (self._last_start + self.execute_delay - time.monotonic())
+                    if self.execute_delay
+                    else 0,
+                )
+                if wait_time <= 0:
+                    break
+                # Wait until the tokens leak out, or until a refund or a new estimate may let the request start sooner.
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+            if self.requests:
+                self.requests.add(1)
+            if self.tokens:
+                self.tokens.add(tokens)
+            self._last_start = time.monotonic()
+        return Reservation(self, model, prompt_tokens, tokens)
+
+    def _reconcile(self, reservation: Reservation, tokens: int, completion_tokens: int):
+        if self.tokens:
+            self.tokens.add(tokens - reservation.tokens)
+        seen_tokens, responses = self._completion_tokens.get(reservation.model, (0, 0))
+        self._completion_tokens[reservation.model] = (
+            seen_tokens + completion_tokens,
+            responses + 1,
         )
-        total_tokens = input_tokens + max_tokens_estimate
+        self._changed.set()
+
+    def _release(self, reservation: Reservation):
+        if self.tokens:
+            self.tokens.add(reservation.prompt_tokens - reservation.tokens)
+        self._changed.set()
 
-        # waiter = _Waiter(total_tokens)
-        # executor = await self._start_waiting(waiter)
-        await self.limiter.acquire(total_tokens)
+    async def rate_limit_completion(self, **completion_args) -> ModelResponse:
+        reservation = await self.reserve(
+            completion_args["model"],
+            token_counter(completion_args["model"], messages=completion_args["messages"]),
+        )
         try:
             res: ModelResponse = await acompletion(**completion_args)  # type: ignore
-            # executor.tokens = res.usage.total_tokens  # type: ignore
-            return res
-        finally:
-            # executor.end()
-            pass
-
-    # def __del__(self):
-    #     self._task.cancel()
+        except BaseException:
+            reservation.release()
+            raise
+        reservation.reconcile(res)
+        return res
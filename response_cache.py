@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable
+from copy import deepcopy
+from litellm import ModelResponse
+import asyncio
+import json
+import time
+
+from disk_cache import DiskCache, content_key
+
+# Completion arguments that don't change the response.
+TRANSPORT_ARGS = frozenset(["timeout", "num_retries", "api_key", "api_base"])
+
+
+class ResponseCache(DiskCache):
+    """
+    Model responses stored in SQLite by a hash of the request, so identical prompts (e.g. when re-running evals or resuming a run) are only paid for once.
+    Responses older than `max_age` seconds expire, and the least recently used are evicted once the cache is larger than `max_bytes`.
+    Identical requests made at the same time are coalesced into one.
+    Responses served from the cache (or another request) are marked with `_hidden_params["cache_hit"]`, like LiteLLM's own caching.
+    """
+
+    def __init__(self, path: str, max_bytes: int, max_age: float):
+        super().__init__(path, max_bytes, max_age)
+        self._in_flight: dict[str, asyncio.Future[ModelResponse]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, messages: list, completion_args: dict[str, Any]) -> str:
+        return content_key(
+            model,
+            json.dumps(messages, sort_keys=True),
+            json.dumps(
+                dict(
+                    (name, value)
+                    for name, value in completion_args.items()
+                    if name not in TRANSPORT_ARGS
+                ),
+                sort_keys=True,
+                default=str,
+            ),
+        )
+
+    def get(self, key: str) -> ModelResponse | None:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        # Responses are stored with when they were created, since they expire even if they're used.
+        created, response = entry
+        if created < time.time() - self.max_age:  # type: ignore
+            self.delete(key)
+            return None
+        return response
+
+    def set(self, key: str, response: ModelResponse):
+        super().set(key, (time.time(), response))
+
+    async def get_or_create(
+        self, key: str, create: Callable[[], Awaitable[ModelResponse]]
+    ) -> ModelResponse:
+        """The cached response for a key, the response of an identical request in flight, or a new response from `create`."""
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            # Shielded, so one caller being cancelled doesn't cancel the request for the others.
+            return self._hit(deepcopy(await asyncio.shield(in_flight)))
+        response = self.get(key)
+        if response is not None:
+            return self._hit(response)
+        self.misses += 1
+        in_flight = asyncio.ensure_future(create())
+        self._in_flight[key] = in_flight
+        try:
+            response = await asyncio.shield(in_flight)
+        finally:
+            if in_flight.done():
+                del self._in_flight[key]
+            else:
+                in_flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Responses without a result aren't cached, so they're retried next time.
+        if response.choices and response.choices[0].message.content:  # type: ignore
+            self.set(key, response)
+        return response
+
+    def _hit(self, response: ModelResponse) -> ModelResponse:
+        self.hits += 1
+        response._hidden_params["cache_hit"] = True
+        return response
+
+    def __str__(self):
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
@@ -8,13 +8,28 @@ from evaluate import Evaluator
 from generator import Generator
 from typing import TYPE_CHECKING, Any
 from config import (
+    BATCH_COST_FACTOR,
+    BATCH_MAX_BYTES,
+    BATCH_MAX_REQUESTS,
+    BATCH_POLL_SECS,
+    COMPLETION_ARGS,
     COST_UPDATE_INTERVAL,
     INTERVAL_SECS,
+    MODEL,
     REQUESTS_PER_INTERVAL,
     TOKENS_PER_INTERVAL,
 )
+from batch import (
+    MessageBatches,
+    batch_request,
+    is_batchable,
+    message_text,
+    split_batches,
+)
+from litellm import cost_per_token
 from tqdm.asyncio import tqdm as tqdm_async
 from math import ceil
+import asyncio
 import logging
 
 from character_filter import CharacterFilter
@@ -29,6 +44,7 @@ from match import PreparedMatch
 if TYPE_CHECKING:
     from db import RunsDatabase, RunID
     from match import MatchResult
+    from rate_limit import RateLimit
     from source_manager import SourceManager
 
 
@@ -97,14 +113,8 @@ class Run:
     def to_object(self):
         return self.settings.to_object()
 
-    async def start(
-        self,
-        source_manager: SourceManager,
-        rate_limit: AsyncLimiter,
-        verbose: bool = False,
-        cost_update_interval=COST_UPDATE_INTERVAL,
-    ) -> tuple[list[MatchResult], float]:
-        print("Starting Run")
+    def _prepare(self, source_manager: SourceManager):
+        """Record the run and generate its matches, unless it's being resumed."""
         if self.db and not self.run_id:
             self.run_id = self.db.start_run(self)
         if self.remaining_matches == None:
@@ -115,6 +125,23 @@ class Run:
             )
         if self.results == None:
             self.results = []
+
+    def _print_cache_stats(self, source_manager: SourceManager):
+        print(source_manager.character_cache)
+        if self.settings.evaluator:
+            print(self.settings.evaluator.description_cache_stats)
+            if self.settings.evaluator.response_cache:
+                print(self.settings.evaluator.response_cache)
+
+    async def start(
+        self,
+        source_manager: SourceManager,
+        rate_limit: AsyncLimiter | RateLimit,
+        verbose: bool = False,
+        cost_update_interval=COST_UPDATE_INTERVAL,
+    ) -> tuple[list[MatchResult], float]:
+        print("Starting Run")
+        self._prepare(source_manager)
         cost = 0
         next_cost_update = cost_update_interval
         print("Running Matches...")
@@ -144,6 +171,108 @@ class Run:
             coroutines.append(evaluate(match))
         await tqdm_async.gather(*coroutines)
         print("Done!")
+        self._print_cache_stats(source_manager)
         if self.db:
             self.db.end_run(self, True)
         return self.results, cost
+
+    async def start_batch(
+        self,
+        source_manager: SourceManager,
+        batches: MessageBatches | None = None,
+        poll_interval: float = BATCH_POLL_SECS,
+        verbose: bool = False,
+        model: str = MODEL,
+    ) -> tuple[list[MatchResult], float]:
+        """
+        Run the remaining matches with Anthropic's Message Batches API instead of real-time completions:
+        submit them in batches, wait for the batches to end, and record their results.
+        Batches are recorded in the database, so a run restarted while they're processing collects their results instead of resubmitting them.
+        Matches whose requests failed are left unfinished, to be submitted again when the run is resumed.
+        """
+        print("Starting Run (Batched)")
+        if self.dry_run:
+            raise ValueError("Dry runs can't use batches!")
+        if not self.db:
+            raise ValueError("Batched runs need a database to collect their results.")
+        if not is_batchable(model):
+            raise ValueError(f"{model} can't be used in batches!")
+        self._prepare(source_manager)
+        evaluator: Evaluator = self.settings.evaluator  # type: ignore
+        if evaluator == None:
+            raise ValueError("Cannot evaluator matches without an evaluator!")
+        batches = batches or MessageBatches()
+        matches = dict((match.match_id, match) for match in self.remaining_matches)  # type: ignore
+        pending = self.db.get_pending_batches(self.run_id)  # type: ignore
+        submitted = set(
+            match_id for _, match_ids in pending.values() for match_id in match_ids
+        )
+        unsubmitted = [
+            match for match in matches.values() if match.match_id not in submitted
+        ]
+        requests = (
+            batch_request(
+                str(match.match_id),
+                model,
+                evaluator.messages(
+                    evaluator.format(match.character_a, match.character_b, model)
+                ),
+                COMPLETION_ARGS,
+            )
+            for match in unsubmitted
+        )
+        # Requests are built as they're added to a batch, so only one batch is held at a time.
+        for chunk in split_batches(requests, BATCH_MAX_REQUESTS, BATCH_MAX_BYTES):
+            batch = await batches.create(chunk)
+            match_ids = [int(request["custom_id"]) for request in chunk]
+            self.db.start_batch(batch["id"], self.run_id, model, match_ids)  # type: ignore
+            pending[batch["id"]] = (model, match_ids)  # type: ignore
+        print(f"Waiting for {len(pending)} batch(es) of {len(matches)} matches...")
+        cost = 0
+        while pending:
+            for batch_id, (batch_model, _) in list(pending.items()):
+                batch = await batches.retrieve(batch_id)
+                if batch["processing_status"] != "ended":
+                    continue
+                for result in await batches.results(batch):
+                    match = matches.get(int(result["custom_id"]))
+                    if match == None:
+                        continue
+                    if result["result"]["type"] != "succeeded":
+                        logger.warning(
+                            "Batched match %s vs. %s %s.",
+                            match.character_a.id,
+                            match.character_b.id,
+                            result["result"]["type"],
+                        )
+                        continue
+                    del matches[match.match_id]
+                    message = result["result"]["message"]
+                    match_cost = BATCH_COST_FACTOR * sum(
+                        cost_per_token(
+                            model=batch_model,
+                            prompt_tokens=message["usage"]["input_tokens"],
+                            completion_tokens=message["usage"]["output_tokens"],
+                        )
+                    )
+                    w_l = evaluator.winner_and_loser(
+                        message_text(message),
+                        match.character_a,
+                        match.character_b,
+                        verbose,
+                    )
+                    self.results.append(
+                        match.record(w_l, match_cost, evaluator.match_settings(batch_model))
+                    )
+                    cost += match_cost
+                self.db.end_batch(batch_id)
+                del pending[batch_id]
+                print(f"Batch {batch_id} ended. Running Cost", cost)
+            if pending:
+                await asyncio.sleep(poll_interval)
+        # Matches that failed are left to be resubmitted.
+        self.remaining_matches = list(matches.values())
+        print("Done!")
+        self._print_cache_stats(source_manager)
+        self.db.end_run(self, not self.remaining_matches)
+        return self.results, cost
@@ -1,13 +1,39 @@
 from abc import ABC, abstractmethod
 from os.path import exists, join
 from os import makedirs
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+import os
 
 from aiolimiter import AsyncLimiter
 from httpx import AsyncClient
 from character import Character, CharacterId
-from typing import Iterable, TYPE_CHECKING
-from config import ASYNC_CLIENT, DOWNLOADS_FOLDER
-from utils import copying_cache
+from typing import Iterable, Iterator, TYPE_CHECKING
+from config import (
+    ASYNC_CLIENT,
+    DOWNLOADS_FOLDER,
+    CHARACTER_PROCESSES,
+    CHARACTER_CHUNK_SIZE,
+)
+
+# The source loaded by each process of a batch extraction pool.
+_worker_source: "Source | None" = None
+
+
+def _init_worker(source_type: "type[Source]", downloads_folder: str):
+    global _worker_source
+    _worker_source = source_type(downloads_folder)
+    _worker_source.parse()
+
+
+def _get_worker_character(character_name: str, meta_only: bool) -> Character | Exception:
+    try:
+        character = _worker_source.get_character(character_name, meta_only=meta_only)  # type: ignore
+    except Exception as e:
+        return e
+    # The source can't be sent between processes; the caller reattaches its own.
+    character.source = None
+    return character
 
 
 class Source(ABC):
@@ -25,8 +51,11 @@ class Source(ABC):
         self,
         downloads_folder: str = DOWNLOADS_FOLDER,
     ):
+        self.downloads_folder = downloads_folder
         self.path = join(downloads_folder, self.SOURCE_ID)
         self.parsed = False
+        self._character_names: tuple[str, ...] | None = None
+        self._character_name_set: frozenset[str] | None = None
 
     @property
     def downloaded(self) -> bool:
@@ -45,29 +74,156 @@ class Source(ABC):
             if not self.downloaded:
                 await self.download()
             self.parse()
+        self.load_manifest()
+
+    def load_manifest(self):
+        """Load (or build) precomputed character metadata, if the source supports it."""
+        pass
 
     @abstractmethod
     def get_character(self, character_name: str, meta_only=False) -> Character:
         pass
 
-    def get_character_length_estimate(self, character_name: str) -> int:
-        sections = self.get_character(character_name).sections
-        if sections is None:
+    def get_characters(
+        self,
+        character_names: Iterable[str],
+        meta_only=False,
+        return_exceptions=False,
+        processes: int | None = CHARACTER_PROCESSES,
+    ) -> list[Character | Exception]:
+        """
+        Get many characters at once, in order.
+        With more than one process, the characters are extracted in chunks by a process pool, each process loading its own copy of the source.
+        With `return_exceptions`, characters that couldn't be extracted are returned as their exception instead of raising it.
+        """
+        return list(
+            self.iter_characters(
+                character_names, meta_only, return_exceptions, processes
+            )
+        )
+
+    def iter_characters(
+        self,
+        character_names: Iterable[str],
+        meta_only=False,
+        return_exceptions=False,
+        processes: int | None = CHARACTER_PROCESSES,
+    ) -> Iterator[Character | Exception]:
+        """
+        Like `get_characters`, but yields the characters in batches of `CHARACTER_CHUNK_SIZE` per process,
+        so only one batch is held at a time. The process pool is started once and shared by the batches.
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        batch_size = CHARACTER_CHUNK_SIZE * processes
+        names = iter(character_names)
+        executor: ProcessPoolExecutor | None = None
+        try:
+            while batch := list(islice(names, batch_size)):
+                results: list[Character | Exception | None] = [
+                    self.get_precomputed_character(character_name, meta_only)
+                    for character_name in batch
+                ]
+                remaining = [i for i, result in enumerate(results) if result is None]
+                if executor is None and (
+                    processes <= 1 or len(remaining) <= CHARACTER_CHUNK_SIZE
+                ):
+                    for i in remaining:
+                        try:
+                            results[i] = self.get_character(batch[i], meta_only=meta_only)
+                        except Exception as e:
+                            results[i] = e
+                elif remaining:
+                    if executor is None:
+                        # A short batch is the last one, so it doesn't need more processes than chunks.
+                        if len(batch) < batch_size:
+                            processes = -(-len(remaining) // CHARACTER_CHUNK_SIZE)
+                        executor = ProcessPoolExecutor(
+                            processes,
+                            initializer=_init_worker,
+                            initargs=(type(self), self.downloads_folder),
+                        )
+                    for i, result in zip(
+                        remaining,
+                        executor.map(
+                            _get_worker_character,
+                            [batch[i] for i in remaining],
+                            repeat(meta_only),
+                            chunksize=CHARACTER_CHUNK_SIZE,
+                        ),
+                    ):
+                        if isinstance(result, Character):
+                            result.source = self
+                        results[i] = result
+                for result in results:
+                    if isinstance(result, Exception) and not return_exceptions:
+                        raise result
+                    yield result  # type: ignore
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def get_precomputed_character(
+        self, character_name: str, meta_only=False
+    ) -> Character | None:
+        """A character that can be returned without extracting it (e.g. from precomputed metadata), if any."""
+        return None
+
+    def get_character_length_estimate(
+        self, character_name: str, abridged: bool = False
+    ) -> int:
+        character = self.get_character(character_name)
+        if abridged:
+            return len(character.abridged_text())
+        if character.sections is None:
             raise ValueError("Character was initialized without sections.")
-        return sum(len(section.text) for section in sections)
+        return sum(len(section.text) for section in character.sections)
+
+    def get_character_universe(self, character_name: str) -> str | None:
+        """The universe (e.g. a Marvel reality) the character belongs to, if the source has more than one."""
+        return None
+
+    def get_character_categories(self, character_name: str) -> list[str]:
+        """The categories the character's page is in, if the source has categories."""
+        return []
+
+    def get_characters_in_category(self, category_name: str) -> list[str]:
+        """The names of the characters in a category, if the source has categories."""
+        return []
 
     @abstractmethod
     def _all_character_names(self) -> Iterable[str]:
         pass
 
-    @copying_cache
+    @property
+    def character_names(self) -> tuple[str, ...]:
+        """The names of every character, in order. Built once, the first time it's needed after parsing."""
+        if self._character_names is None:
+            self._character_names = tuple(dict.fromkeys(self._all_character_names()))
+            self._character_name_set = frozenset(self._character_names)
+        return self._character_names
+
+    @property
+    def character_name_set(self) -> frozenset[str]:
+        """The names of every character, for membership tests."""
+        if self._character_name_set is None:
+            self.character_names
+        return self._character_name_set  # type: ignore
+
+    def is_character_name(self, character_name: str) -> bool:
+        return character_name in self.character_name_set
+
+    def clear_character_names(self):
+        """Discard the character name index, e.g. when the source's data changes."""
+        self._character_names = None
+        self._character_name_set = None
+
     def all_character_names(self) -> list[str]:
-        return list(self._all_character_names())
+        return list(self.character_names)
 
     def all_character_ids(self) -> Iterable[CharacterId]:
-        for character_name in self._all_character_names():
+        for character_name in self.character_names:
             yield CharacterId(self.SOURCE_ID, character_name)
 
     def all_characters(self, meta_only: bool = False) -> Iterable[Character]:
-        for character_name in self.all_character_names():
-            yield self.get_character(character_name, meta_only=meta_only)
+        yield from self.iter_characters(self.character_names, meta_only=meta_only)  # type: ignore
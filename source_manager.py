@@ -1,8 +1,8 @@
 from typing import Iterable
 from character import Character, CharacterId
+from character_cache import CharacterCache
 from source import Source
 from config import *
-import functools
 
 from one_piece import OnePieceWiki
 from marvel import MarvelWiki
@@ -16,6 +16,7 @@ class SourceManager:
     def __init__(self, download_path: str = DOWNLOADS_FOLDER):
         self.download_path = download_path
         self.sources: dict[str, Source] = {}
+        self.character_cache = CharacterCache(CHARACTER_CACHE_BYTES)
 
     async def load_source(self, source_id: str):
         if source_id not in self.sources:
@@ -26,21 +27,81 @@ class SourceManager:
         else:
             return self.sources[source_id]
 
-    @functools.lru_cache(maxsize=8192)
     def get_character(self, character_id: CharacterId, meta_only=False):
-        return self.sources[character_id.source_id].get_character(
-            character_id.name, meta_only=meta_only
-        )
+        character = self.character_cache.get(character_id, meta_only)
+        if character is None:
+            character = self.sources[character_id.source_id].get_character(
+                character_id.name, meta_only=meta_only
+            )
+            self.character_cache.add(character)
+        return character
+
+    def get_characters(
+        self,
+        character_ids: Iterable[CharacterId],
+        meta_only=False,
+        return_exceptions=False,
+    ) -> list[Character | Exception]:
+        """
+        Get many characters at once, in order. Characters that aren't cached are extracted in a batch by each source, and cached.
+        With `return_exceptions`, characters that couldn't be extracted are returned as their exception instead of raising it.
+        """
+        character_ids = list(character_ids)
+        results: dict[CharacterId, Character | Exception] = {}
+        missing: dict[str, list[CharacterId]] = {}
+        for character_id in dict.fromkeys(character_ids):
+            character = self.character_cache.get(character_id, meta_only)
+            if character is not None:
+                results[character_id] = character
+            else:
+                missing.setdefault(character_id.source_id, []).append(character_id)
+        for source_id, source_character_ids in missing.items():
+            characters = self.sources[source_id].get_characters(
+                [character_id.name for character_id in source_character_ids],
+                meta_only=meta_only,
+                return_exceptions=True,
+            )
+            for character_id, character in zip(source_character_ids, characters):
+                results[character_id] = character
+                if isinstance(character, Character):
+                    self.character_cache.add(character)
+        ordered_results = [results[character_id] for character_id in character_ids]
+        if not return_exceptions:
+            for result in ordered_results:
+                if isinstance(result, Exception):
+                    raise result
+        return ordered_results
 
-    def get_character_length_estimate(self, character_id: CharacterId):
+    def get_character_length_estimate(
+        self, character_id: CharacterId, abridged: bool = False
+    ):
         return self.sources[character_id.source_id].get_character_length_estimate(
+            character_id.name, abridged=abridged
+        )
+
+    def get_character_universe(self, character_id: CharacterId) -> str | None:
+        return self.sources[character_id.source_id].get_character_universe(
             character_id.name
         )
 
+    def get_character_categories(self, character_id: CharacterId) -> list[str]:
+        return self.sources[character_id.source_id].get_character_categories(
+            character_id.name
+        )
+
+    def get_characters_in_category(
+        self, source_id: str, category_name: str
+    ) -> list[CharacterId]:
+        return [
+            CharacterId(source_id, character_name)
+            for character_name in self.sources[source_id].get_characters_in_category(
+                category_name
+            )
+        ]
+
     def all_characters(self) -> Iterable[Character]:
         for source in self.sources.values():
-            for character_name in source.all_character_names():
-                yield source.get_character(character_name)
+            yield from source.all_characters()
 
     def all_character_ids(self) -> Iterable[CharacterId]:
         for source in self.sources.values():
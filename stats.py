@@ -1,6 +1,6 @@
-from aiolimiter import AsyncLimiter
 from config import *
 from evaluate import Evaluator
+from rate_limit import RateLimit
 from source_manager import SourceManager
 import logging
 from character import CharacterId
@@ -95,7 +95,9 @@ async def main():
 
     run = Run("marvel_vs_onepiece_1", generator, evaluator, db, False)
 
-    results, cost = await run.start(source_manager, AsyncLimiter(1, 3), verbose=True)
+    results, cost = await run.start(source_manager, RateLimit(), verbose=True)
+    # Or, to run the matches with Anthropic's Message Batches API (results take longer, for half the price):
+    # results, cost = await run.start_batch(source_manager, verbose=True)
     with open("results.txt", "w") as file:
         for result in run.results:
             file.write(
@@ -0,0 +1,216 @@
+"""
+Runs the batched run mode against a stand-in for Anthropic's Message Batches API (served through an httpx mock transport),
+covering batch creation and results, failed requests being resubmitted, a restart while batches are still processing,
+and splitting batches by size.
+Run with `python test_batch.py` (or pytest).
+"""
+
+from tempfile import TemporaryDirectory
+from os.path import join
+from httpx import AsyncClient, MockTransport, Request, Response
+import asyncio
+import itertools
+import json
+
+from batch import MessageBatches
+from character import Character, CharacterId, Section
+from db import RunsDatabase
+from evaluate import Evaluator
+from match import PreparedMatch
+import run as run_module
+from run import Run
+from source_manager import SourceManager
+
+API_BASE = "https://batches.invalid"
+MODEL = "claude-sonnet-4-5"
+
+
+class StandInBatches:
+    """
+    Implements the Message Batches endpoints the client uses. Each batch ends after it's been retrieved `polls` times.
+    Requests whose prompt contains one of the `failing` strings are errored; the rest are won by character B.
+    """
+
+    def __init__(self, polls: int = 2):
+        self.polls = polls
+        self.batches: dict[str, dict] = {}
+        self.failing: set[str] = set()
+        self._ids = itertools.count()
+
+    def handle(self, request: Request) -> Response:
+        assert request.headers["x-api-key"] and request.headers["anthropic-version"]
+        path = request.url.path.removeprefix("/v1/messages/batches").strip("/")
+        if request.method == "POST" and not path:
+            batch_id = f"msgbatch_{next(self._ids)}"
+            self.batches[batch_id] = {
+                "requests": json.loads(request.content)["requests"],
+                "polls": 0,
+            }
+            return Response(200, json={"id": batch_id, "processing_status": "in_progress"})
+        if request.method == "GET" and path.endswith("/results"):
+            batch = self.batches[path.removesuffix("/results")]
+            return Response(
+                200, text="\n".join(json.dumps(self._result(r)) for r in batch["requests"])
+            )
+        if request.method == "GET" and path in self.batches:
+            batch = self.batches[path]
+            batch["polls"] += 1
+            ended = batch["polls"] >= self.polls
+            return Response(
+                200,
+                json={
+                    "id": path,
+                    "processing_status": "ended" if ended else "in_progress",
+                    "results_url": f"{API_BASE}/v1/messages/batches/{path}/results",
+                },
+            )
+        return Response(404)
+
+    def _result(self, request: dict) -> dict:
+        prompt = request["params"]["messages"][-1]["content"]
+        if any(failing in prompt for failing in self.failing):
+            result = {"type": "errored", "error": {"type": "overloaded_error"}}
+        else:
+            winner = prompt.split(" vs ")[1]
+            result = {
+                "type": "succeeded",
+                "message": {
+                    "content": [{"type": "text", "text": f"Reasoning.\nWinner: {winner}"}],
+                    "usage": {"input_tokens": 100, "output_tokens": 20},
+                },
+            }
+        return {"custom_id": request["custom_id"], "result": result}
+
+
+def _setup(folder: str, stand_in: StandInBatches):
+    db = RunsDatabase(join(folder, "runs.sqlite"))
+    db.initialize_db()
+    evaluator = Evaluator(
+        prompt_raw="{{character_a.name}} vs {{character_b.name}}",
+        winner_prefix="Winner: ",
+        information_raw={"test": {"name": "Test"}},
+        cache_responses=False,
+    )
+    characters = [
+        Character(CharacterId("test", f"Character {i}"), "1", [Section(f"Text {i}", 1)], None)
+        for i in range(5)
+    ]
+    run = Run("batched", None, evaluator, db, False)
+    run.run_id = db.start_run(run)
+    run.remaining_matches = [
+        PreparedMatch(run.run_id, characters[i], characters[i + 1], db) for i in range(4)
+    ]
+    batches = MessageBatches(
+        API_BASE, "key", AsyncClient(transport=MockTransport(stand_in.handle))
+    )
+    return db, evaluator, run, batches, SourceManager(folder)
+
+
+def _resumed(run: Run, evaluator: Evaluator, db: RunsDatabase) -> Run:
+    """The run as it's loaded from the database after a restart, with its unfinished matches."""
+    return Run(
+        run.name,
+        None,
+        evaluator,
+        db,
+        False,
+        run.run_id,
+        [
+            PreparedMatch(run.run_id, match.character_a, match.character_b, db, match.match_id)
+            for match in run.remaining_matches  # type: ignore
+        ],
+        [],
+    )
+
+
+def test_batch_results():
+    stand_in = StandInBatches()
+    with TemporaryDirectory() as folder:
+        db, _, run, batches, source_manager = _setup(folder, stand_in)
+        results, cost = asyncio.run(
+            run.start_batch(source_manager, batches, poll_interval=0, model=MODEL)
+        )
+        assert len(stand_in.batches) == 1
+        assert len(results) == 4 and cost > 0
+        for result in results:
+            assert result.outcome is not None
+        assert run.remaining_matches == []
+        assert db.get_pending_batches(run.run_id) == {}  # type: ignore
+
+
+def test_failed_results_are_resubmitted():
+    stand_in = StandInBatches()
+    stand_in.failing.add("Character 2 vs")
+    with TemporaryDirectory() as folder:
+        db, evaluator, run, batches, source_manager = _setup(folder, stand_in)
+        results, _ = asyncio.run(
+            run.start_batch(source_manager, batches, poll_interval=0, model=MODEL)
+        )
+        assert len(results) == 3
+        assert [match.character_a.name for match in run.remaining_matches] == ["Character 2"]  # type: ignore
+        assert db.get_pending_batches(run.run_id) == {}  # type: ignore
+        # Resuming submits only the failed match.
+        stand_in.failing.clear()
+        resumed = _resumed(run, evaluator, db)
+        results, _ = asyncio.run(
+            resumed.start_batch(source_manager, batches, poll_interval=0, model=MODEL)
+        )
+        assert len(stand_in.batches) == 2
+        assert len(stand_in.batches["msgbatch_1"]["requests"]) == 1
+        assert len(results) == 1 and resumed.remaining_matches == []
+
+
+def test_restart_with_pending_batches():
+    stand_in = StandInBatches(polls=3)
+    with TemporaryDirectory() as folder:
+        db, evaluator, run, batches, source_manager = _setup(folder, stand_in)
+
+        async def interrupted():
+            # Stop waiting once the batch is submitted, like a crash while it's processing.
+            task = asyncio.create_task(
+                run.start_batch(source_manager, batches, poll_interval=0.01, model=MODEL)
+            )
+            while not stand_in.batches or stand_in.batches["msgbatch_0"]["polls"] < 1:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(interrupted())
+        pending = db.get_pending_batches(run.run_id)  # type: ignore
+        assert list(pending) == ["msgbatch_0"] and len(pending["msgbatch_0"][1]) == 4
+        # The restarted run collects the pending batch instead of resubmitting its matches.
+        resumed = _resumed(run, evaluator, db)
+        results, _ = asyncio.run(
+            resumed.start_batch(source_manager, batches, poll_interval=0, model=MODEL)
+        )
+        assert len(stand_in.batches) == 1
+        assert len(results) == 4 and resumed.remaining_matches == []
+        assert db.get_pending_batches(run.run_id) == {}  # type: ignore
+
+
+def test_batches_are_split_by_size():
+    stand_in = StandInBatches()
+    max_bytes = run_module.BATCH_MAX_BYTES
+    with TemporaryDirectory() as folder:
+        db, _, run, batches, source_manager = _setup(folder, stand_in)
+        # Room for two requests per batch.
+        run_module.BATCH_MAX_BYTES = 400
+        try:
+            results, _ = asyncio.run(
+                run.start_batch(source_manager, batches, poll_interval=0, model=MODEL)
+            )
+        finally:
+            run_module.BATCH_MAX_BYTES = max_bytes
+        assert [len(batch["requests"]) for batch in stand_in.batches.values()] == [2, 2]
+        assert len(results) == 4 and run.remaining_matches == []
+
+
+if __name__ == "__main__":
+    test_batch_results()
+    test_failed_results_are_resubmitted()
+    test_restart_with_pending_batches()
+    test_batches_are_split_by_size()
+    print("Batch tests passed!")
@@ -85,13 +85,18 @@ async def main():
 
     sorted_ratings = sorted(list(ratings.items()), key=lambda r: r[1], reverse=True)
 
-    for character_id, rating in sorted_ratings:
-        try:
-            character = source_manager.get_character(character_id, meta_only=True)
-            grade = rating_to_grade(rating, grades)
-            tiers[grade].append(character)
-        except NotACharacterException:
-            pass
+    characters = source_manager.get_characters(
+        [character_id for character_id, _ in sorted_ratings],
+        meta_only=True,
+        return_exceptions=True,
+    )
+    for (character_id, rating), character in zip(sorted_ratings, characters):
+        if isinstance(character, NotACharacterException):
+            continue
+        elif isinstance(character, Exception):
+            raise character
+        grade = rating_to_grade(rating, grades)
+        tiers[grade].append(character)
 
     with open("result.html", "w") as result_file:
         result_file.write(
@@ -1,15 +1,68 @@
-from typing import Callable, Any, TypeVar
+from queue import Queue, Empty
+from config import PIPELINE_BUFFER_CHUNKS
 
 
-def copying_cache(method: Callable[[Any], list[Any]]):
-    cache: list[Any] | None = None
+class BoundedPipe:
+    """
+    A file-like pipe for passing a byte stream between threads.
+    Writes block while `max_chunks` chunks are buffered, so a fast producer can't outrun the consumer.
+    The reader can abort the pipe (or exit its context) to stop reading early, and later writes raise BrokenPipeError.
+    """
 
-    def wrapper(self):
-        nonlocal cache
-        if cache is not None:
-            return cache.copy()
+    def __init__(self, max_chunks: int = PIPELINE_BUFFER_CHUNKS):
+        self._chunks: Queue[bytes | BaseException | None] = Queue(max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self.aborted = False
+
+    def write(self, data: bytes) -> int:
+        if self.aborted:
+            raise BrokenPipeError("The pipe's reader stopped reading")
+        if data:
+            self._chunks.put(bytes(data))
+        return len(data)
+
+    def close(self, exception: BaseException | None = None):
+        """Signal the end of the stream. If `exception` is provided, it's raised in the reader."""
+        if not self.aborted:
+            self._chunks.put(exception)
+
+    def abort(self):
+        """Stop reading. Buffered chunks are dropped, which wakes a blocked writer, and later writes raise."""
+        self.aborted = True
+        self._eof = True
+        self._buffer.clear()
+        while True:
+            try:
+                self._chunks.get_nowait()
+            except Empty:
+                break
+
+    def _next_chunk(self):
+        chunk = self._chunks.get()
+        if chunk is None:
+            self._eof = True
+        elif isinstance(chunk, BaseException):
+            self._eof = True
+            raise chunk
         else:
-            cache = method(self)
-            return cache.copy()
+            self._buffer += chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.abort()
 
-    return wrapper
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            while not self._eof:
+                self._next_chunk()
+        elif not self._buffer and not self._eof:
+            self._next_chunk()
+        if size < 0:
+            size = len(self._buffer)
+        # Deleting from the front of a bytearray doesn't copy what's left.
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data